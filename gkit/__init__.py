@@ -1,6 +1,11 @@
-from .core import Raster, zonal_apply, split_by_shp, uniform_mask
+from .core import Raster, zonal_apply, zonal_stats, split_by_shp, \
+    iter_split_by_shp, iter_zones, uniform_mask, WarpPlan, RasterStack, \
+    MaskCache
 from .math import *
-from .io import read, read_gdal, save
+from .io import read, read_gdal, save, LazyRaster, mosaic, build_vrt
+from .tile import tiled_apply
+from .expr import Expression
+from .timeseries import TimeSeries
 
 
 __version__ = "0.7.1"
@@ -1,52 +1,247 @@
 import os
-import re
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, \
+    wait, FIRST_COMPLETED
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
 
 import fire
 
 import gkit as gk
-from gkit.math import *
+from gkit.expr import Expression
+from gkit.discover import discover as _discover
 
 
-def loader(*args):
-    for fn in args:
-        if "re://" in fn:
-            fn = re.compile(fn[5:])
-            files = filter(
-                lambda f: re.search(fn, str(f)) is not None,
-                Path(".").rglob("*")
-            )
-            for fn in list(files):
-                yield gk.read(str(fn))
-        else:
-            yield gk.read(fn)
+def discover(*args, index=None, extensions=None):
+    """Expand ``re://`` patterns into file paths.
+
+    See :func:`gkit.discover.discover`.
+    """
+    return _discover(*args, extensions=extensions, index=index)
+
+
+def loader(*args, index=None, extensions=None):
+    for fn in discover(*args, index=index, extensions=extensions):
+        yield gk.read(fn)
+
+
+def _discover_options(kwargs):
+    """``index`` and ``extensions`` of the ``--index`` and ``--all_files``
+    flags."""
+    return {"index": kwargs.get('index'),
+            "extensions": () if kwargs.get('all_files') else None}
+
+
+# Rasterized shapefile masks, shared by the files of one process.
+_MASK_CACHE = gk.MaskCache()
+
+
+def _out_path(out, r):
+    return os.path.join(out, os.path.basename(r.filepath))
+
+
+def _clip_by_shp(r, shp_path, out):
+    return r.clip_by_shp(shp_path, cache=_MASK_CACHE), _out_path(out, r)
+
+
+@lru_cache(maxsize=None)
+def _expression(formula):
+    """Parse a formula once per process."""
+    return Expression(formula)
+
+
+def _map(r, formula, out):
+    return _expression(formula)(r=r), _out_path(out, r)
+
+
+def _job(filepath, compute, *args):
+    """Read a file, ``compute(raster, *args)`` and save the result."""
+    res, out_path = compute(gk.read(filepath), *args)
+    res.save(out_path)
+
+
+def _report(finished, total, fn, error=None):
+    if error is None:
+        print("[{}/{}] {}".format(finished, total, fn), file=sys.stderr)
+    else:
+        print("[{}/{}] {} failed: {!r}".format(finished, total, fn, error),
+              file=sys.stderr)
+
+
+def _pipeline(compute, files, args=(), prefetch=2, queue=2,
+              verbose=False):
+    """Run ``compute(raster, *args)`` for each file with I/O overlapped.
+
+    The next ``prefetch`` files are read by background threads while the
+    current one is computed, and results are saved by a writer thread with
+    at most ``queue`` results waiting. GDAL releases the GIL while reading
+    and writing, so the stages run at the same time. With ``verbose``,
+    file names are printed when their computation starts.
+
+    Returns:
+        list: Failed files.
+    """
+    files = list(files)
+    failed = []
+    finished = 0
+
+    def done(fn, error=None):
+        nonlocal finished
+        finished += 1
+        if error is not None:
+            failed.append(fn)
+        _report(finished, len(files), fn, error)
+
+    def drain(n):
+        while len(writes) > n:
+            fn, future = writes.popleft()
+            done(fn, future.exception())
+
+    todo = iter(files)
+    reads = deque()
+    writes = deque()
+    with ThreadPoolExecutor(prefetch) as readers, \
+            ThreadPoolExecutor(1) as writer:
+        for fn in islice(todo, prefetch):
+            reads.append((fn, readers.submit(gk.read, fn)))
+        while reads:
+            fn, future = reads.popleft()
+            for next_fn in islice(todo, 1):
+                reads.append((next_fn, readers.submit(gk.read, next_fn)))
+            if verbose:
+                print(fn)
+            try:
+                res, out_path = compute(future.result(), *args)
+            except Exception as e:
+                done(fn, e)
+                continue
+            drain(queue - 1)
+            writes.append((fn, writer.submit(res.save, out_path)))
+            del res
+        drain(0)
+    return failed
+
+
+def _run(compute, files, args=(), workers=None, verbose=False,
+         prefetch=None):
+    """Read each file, ``compute(raster, *args)`` and save the result.
+
+    ``compute`` returns the result and its output path. With ``workers``,
+    files are processed by a process pool, at most ``2 * workers`` files
+    are in flight. With ``prefetch``, reading, computing and saving are
+    pipelined in threads (see :func:`_pipeline`). In both modes a failed
+    file is reported without stopping the others and progress is printed
+    to stderr. With ``verbose``, file names are printed as they are
+    started in every mode.
+
+    Returns:
+        list: Failed files.
+
+    Raises:
+        ValueError: Both ``workers`` and ``prefetch`` are given.
+    """
+    if workers and workers > 1 and prefetch:
+        raise ValueError(
+            "--workers and --prefetch can not be used together.")
+    if workers and workers > 1:
+        failed = _pool(compute, files, args, workers, verbose)
+    elif prefetch:
+        failed = _pipeline(compute, files, args, prefetch,
+                           verbose=verbose)
+    else:
+        for fn in files:
+            if verbose:
+                print(fn)
+            _job(fn, compute, *args)
+        return []
+
+    if failed:
+        print("{} files failed.".format(len(failed)), file=sys.stderr)
+    return failed
+
+
+def _pool(compute, files, args, workers, verbose=False):
+    files = list(files)
+    failed = []
+    finished = 0
+
+    def report(done):
+        nonlocal finished
+        for future in done:
+            finished += 1
+            fn = pending.pop(future)
+            error = future.exception()
+            if error is not None:
+                failed.append(fn)
+            _report(finished, len(files), fn, error)
+
+    pending = {}
+    with ProcessPoolExecutor(workers) as executor:
+        for fn in files:
+            if len(pending) >= 2 * workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                report(done)
+            if verbose:
+                print(fn)
+            pending[executor.submit(_job, fn, compute, *args)] = fn
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            report(done)
+    return failed
 
 
 class CLI(object):
     @staticmethod
     def clip_by_shp(shp_path, out="./", *args, **kwargs):
+        """Clip rasters by shapefile.
+
+        Use ``--workers N`` to process files in N processes, or
+        ``--prefetch N`` to read the next N files in background threads
+        while the current one is processed and to save results in
+        background; they can not be combined. ``--print`` prints each
+        file name as it is started. ``--index FILE`` saves the file list
+        of ``re://`` patterns and reuses it in later runs. ``re://``
+        patterns only match files with extensions of GDAL raster drivers,
+        ``--all_files`` matches files with any extension. The exit status
+        is 1 when a file failed.
+        """
         if not os.path.exists(out):
             os.makedirs(out)
 
-        for r in loader(*args):
-            if kwargs.get('print'):
-                print(r.filepath)
-            res = r.clip_by_shp(shp_path)
-            res.save(os.path.join(out, os.path.basename(r.filepath)))
+        files = discover(*args, **_discover_options(kwargs))
+        if _run(_clip_by_shp, files, (shp_path, out), kwargs.get('workers'),
+                kwargs.get('print'), kwargs.get('prefetch')):
+            sys.exit(1)
 
     @staticmethod
     def map(formula, out="./", *args, **kwargs):
+        """Apply a formula to each raster, e.g. ``"r * 2"``.
+
+        The formula may use arithmetic, comparisons and the functions of
+        :mod:`gkit.math` (see :class:`gkit.expr.Expression`). Use
+        ``--workers N``, ``--prefetch N``, ``--print``, ``--index FILE``
+        and ``--all_files`` as :meth:`clip_by_shp`.
+        """
+        _expression(formula)  # Reject invalid formulas before reading.
         if not os.path.exists(out):
             os.makedirs(out)
 
-        for r in loader(*args):
-            if kwargs.get('print'):
-                print(r.filepath)
-            res = eval(formula)
-            res.save(os.path.join(out, os.path.basename(r.filepath)))
+        files = discover(*args, **_discover_options(kwargs))
+        if _run(_map, files, (formula, out), kwargs.get('workers'),
+                kwargs.get('print'), kwargs.get('prefetch')):
+            sys.exit(1)
 
     @staticmethod
     def calc(formula, out='out', *args, **kwargs):
+        """Calculate a formula of all rasters, e.g. ``"mean(r) - r[0]"``.
+
+        ``r`` is the list of rasters, or the raster if there is only one.
+        See :meth:`map` for the allowed formulas, ``--index FILE`` and
+        ``--all_files`` as :meth:`clip_by_shp`.
+        """
+        expression = _expression(formula)
         if not args:
             return
 
@@ -54,7 +249,7 @@ class CLI(object):
         if not out.parent.exists():
             os.makedirs(str(out.parent))
 
-        r = list(loader(*args))
+        r = list(loader(*args, **_discover_options(kwargs)))
 
         if kwargs.get('print'):
             for i in r:
@@ -63,13 +258,17 @@ class CLI(object):
         if len(r) == 1:
             r = r[0]
 
-        res = eval(formula)
+        res = expression(r=r)
         res.save(str(out))
 
     @staticmethod
-    def show(raster):
-        """Display a raster file."""
-        gk.read(raster).show()
+    def show(raster, max_size=1024):
+        """Display a raster file.
+
+        Only a preview of at most ``max_size`` pixels wide is read, from
+        overviews when the file has them.
+        """
+        gk.read(raster, lazy=True).show(max_size=max_size)
 
 
 def main():
@@ -1,2 +1,7 @@
-from .raster import Raster
-from .functions import uniform_mask, split_by_shp, zonal_apply
+from .raster import Raster, srs_cache_info, clear_srs_cache
+from .stack import RasterStack
+from .functions import uniform_mask, split_by_shp, iter_split_by_shp, \
+    zonal_apply
+from .zonal import zonal_stats, iter_zones, ZoneIndex
+from .warp import WarpPlan
+from .cache import MaskCache
@@ -0,0 +1,112 @@
+"""Cache of rasterized vector masks.
+
+Clipping many rasters on one grid by the same vector rasterizes the vector
+once. Masks are kept in a LRU cache and may spill to disk when evicted.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class MaskCache(object):
+    """LRU cache of boolean masks (``True`` outside of the geometries).
+
+    Keys are built by :meth:`key` from the vector source and its
+    modification time and size, the layer, the feature filter and the
+    raster grid (transform, shape, projection).
+
+    Args:
+        maxsize (int): Max number of masks kept in memory.
+        spill_dir (str): Save evicted masks into this directory and load
+            them again on demand. Not saved if it is ``None``.
+    """
+    def __init__(self, maxsize=32, spill_dir=None):
+        self.maxsize = maxsize
+        self.spill_dir = spill_dir
+        self.hits = 0
+        self.misses = 0
+        self._masks = OrderedDict()
+        self._lock = threading.Lock()
+        if spill_dir is not None and not os.path.exists(spill_dir):
+            os.makedirs(spill_dir)
+
+    @staticmethod
+    def key(source, raster, layer=0, where=None):
+        """Build a cache key.
+
+        A file rewritten in place gets a new key, its modification time
+        and size are part of the key.
+
+        Args:
+            source (str): Vector file path.
+            raster (Raster): Provides the grid.
+            layer (int, str or ogr.Layer): Layer index, name or the layer.
+            where (str): Attribute filter of features.
+        """
+        path = os.path.abspath(str(source))
+        try:
+            stat = os.stat(path)
+            version = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            # Not a local file, e.g. a /vsi path or a database.
+            version = None
+        if hasattr(layer, "GetName"):
+            layer = layer.GetName()
+        return (path, version, layer, where,
+                tuple(raster.transform), tuple(raster.shape[-2:]),
+                raster.projection)
+
+    def _spill_path(self, key):
+        name = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.spill_dir, name + ".npy")
+
+    def get(self, key, factory):
+        """Get a mask, calling ``factory()`` to build it on a miss."""
+        with self._lock:
+            if key in self._masks:
+                self.hits += 1
+                self._masks.move_to_end(key)
+                return self._masks[key]
+
+        mask = None
+        if self.spill_dir is not None:
+            path = self._spill_path(key)
+            if os.path.exists(path):
+                mask = np.load(path)
+        if mask is None:
+            with self._lock:
+                self.misses += 1
+            mask = np.asarray(factory(), bool)
+        else:
+            with self._lock:
+                self.hits += 1
+        mask.flags.writeable = False
+
+        with self._lock:
+            self._masks[key] = mask
+            self._masks.move_to_end(key)
+            while len(self._masks) > self.maxsize:
+                old_key, old_mask = self._masks.popitem(last=False)
+                if self.spill_dir is not None:
+                    path = self._spill_path(old_key)
+                    if not os.path.exists(path):
+                        np.save(path, old_mask)
+        return mask
+
+    def info(self):
+        """Get ``hits``, ``misses``, ``maxsize`` and ``currsize``."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "maxsize": self.maxsize, "currsize": len(self._masks)}
+
+    def clear(self):
+        """Remove all masks from memory (spilled files are kept)."""
+        with self._lock:
+            self._masks.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._masks)
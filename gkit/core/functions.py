@@ -3,31 +3,29 @@ from osgeo import ogr
 import numpy as np
 
 from .raster import Raster
+from .zonal import zonal_stats, iter_zones, parallel_zonal_apply
 
 
-def split_by_shp(raster, shp_path, by=None, overall=False):
-    """Split rasters into several parties by polygons from shapefile.
+def iter_split_by_shp(raster, shp_path, by=None, overall=False,
+                      crop=False):
+    """Split rasters by polygons from shapefile, one part at a time.
 
-    Args:
-        raster (Raster or list of Raster): One or more rasters.
-        shp_path (str): Shapefile path.
-        by (str): Field name, used to group polygons.(default=FID)
-        overall (bool): Use whole area(combine all polygons) as a result.
-            (default=False)
+    Same as :func:`split_by_shp`, but parts are yielded as soon as they are
+    clipped, and only one part is kept in memory.
 
-    Returns:
-        dict
+    Yields:
+        tuple: ``(key, raster)``, ``raster`` is a list when there are
+        several input rasters.
     """
     raster = [raster] if isinstance(raster, Raster) else list(raster)
     shp = ogr.Open(shp_path)
     layer = shp.GetLayer()
-    result = {}
     if overall:
         overall = 'overall' if overall is True else overall
-        r = [r.clip_by_layer(layer) for r in raster]
+        r = [r.clip_by_layer(layer, crop) for r in raster]
         if len(r) == 1:
             r = r[0]
-        result[overall] = r
+        yield overall, r
 
     # Group features by field values.
     grouped_features = {}
@@ -37,33 +35,69 @@ def split_by_shp(raster, shp_path, by=None, overall=False):
         grouped_features[fid].append(feature)
 
     for key, features in grouped_features.items():
-        r = [r.clip_by_feature(features) for r in raster]
+        r = [r.clip_by_feature(features, crop) for r in raster]
         if len(r) == 1:
             r = r[0]
-        result[key] = r
+        yield key, r
 
-    return result
+
+def split_by_shp(raster, shp_path, by=None, overall=False, crop=False):
+    """Split rasters into several parties by polygons from shapefile.
+
+    Args:
+        raster (Raster or list of Raster): One or more rasters.
+        shp_path (str): Shapefile path.
+        by (str): Field name, used to group polygons.(default=FID)
+        overall (bool): Use whole area(combine all polygons) as a result.
+            (default=False)
+        crop (bool): Crop each part to the envelope of its polygons instead
+            of keeping the full extent. (default=False)
+
+    Returns:
+        dict
+    """
+    return dict(iter_split_by_shp(raster, shp_path, by, overall, crop))
 
 
 def zonal_apply(raster, shp, func, by=None, overall=False,
-                args=(), kwargs={}):
+                args=(), kwargs={}, executor=None, workers=None):
     """Apply a function to each zone.
 
+    All zones are rasterized into one label grid, and ``func`` receives
+    each zone cropped to its bounding box with pixels outside of the zone
+    masked (see :func:`iter_zones`). When zones overlap, a warning is
+    issued and each zone is clipped by its own polygons instead.
+
     Args:
         raster (Raster or list of Raster): One or more rasters.
         shp_path (str): Shapefile path.
-        func (function): Function to apply to each zone.
+        func (function or str): Function to apply to each zone. The name of
+            a built-in reducer (see :func:`zonal_stats`) is calculated for
+            all zones at once.
         by (str): Field name, used to group polygons.(default=FID)
         overall (bool): Use whole area(combine all polygons) as a result.
             (default=False)
+        executor (str or Executor): Apply ``func`` to zones in parallel.
+            ``"thread"`` suits functions releasing the GIL (most numpy
+            reductions), ``"process"`` shares the rasters with the workers
+            through shared memory, ``func`` should then be picklable.
+            An executor instance is used as is. (default=None, serial)
+        workers (int): Number of workers. (default=number of CPUs)
 
     Returns:
         dict
     """
-    splited = split_by_shp(raster, shp, by, overall)
+    if isinstance(func, str):
+        return zonal_stats(raster, shp, func, by, overall)
+
+    if executor is not None or workers is not None:
+        return parallel_zonal_apply(raster, shp, func, by, overall,
+                                    args, kwargs, executor or "thread",
+                                    workers)
+
     result = {}
-    for i, rs in splited.items():
-        result[i] = func(rs, *args, **kwargs)
+    for key, rs in iter_zones(raster, shp, by, overall):
+        result[key] = func(rs, *args, **kwargs)
     return result
 
 
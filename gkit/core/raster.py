@@ -1,9 +1,13 @@
+from functools import lru_cache
+
 import numpy as np
 from numpy.ma import MaskedArray
 from osgeo import gdal, osr, ogr
 from scipy.ndimage.filters import generic_filter as gf
 
 import gkit as gk
+from .rolling import reducer_name, rolling_reduce, compile_kernel, \
+    is_jitted
 
 
 # Data type mapping between numpy and gdal.
@@ -21,6 +25,11 @@ TYPE = {
 }
 
 
+#: Max number of entries in each spatial reference cache.
+SRS_CACHE_SIZE = 256
+
+
+@lru_cache(maxsize=SRS_CACHE_SIZE)
 def _srs_to_wkt(a_srs):
     name, code = a_srs.split(":")
     name = name.upper()
@@ -38,11 +47,290 @@ def _srs_to_wkt(a_srs):
     return projection
 
 
-class Raster(MaskedArray):
+@lru_cache(maxsize=SRS_CACHE_SIZE)
+def _wkt_to_srs(wkt):
+    """Parse WKT into a :class:`osr.SpatialReference`.
+
+    The result is shared by all callers, do not modify it.
+    """
+    return osr.SpatialReference(wkt=wkt)
+
+
+@lru_cache(maxsize=SRS_CACHE_SIZE)
+def _projection_name(wkt):
+    return _wkt_to_srs(wkt).GetAttrValue('geogcs')
+
+
+def srs_cache_info():
+    """Get statistics of the spatial reference caches.
+
+    Returns:
+        dict: Cache name to ``functools`` cache info (hits, misses,
+        maxsize, currsize).
+    """
+    return {
+        "srs_to_wkt": _srs_to_wkt.cache_info(),
+        "wkt_to_srs": _wkt_to_srs.cache_info(),
+        "projection_name": _projection_name.cache_info(),
+    }
+
+
+def clear_srs_cache():
+    """Clear the spatial reference caches."""
+    _srs_to_wkt.cache_clear()
+    _wkt_to_srs.cache_clear()
+    _projection_name.cache_clear()
+
+
+def _window_transform(transform, row, col):
+    """Geotransform of a window starting at pixel ``(row, col)``."""
+    row, col = int(row), int(col)
+    transform = list(transform)
+    transform[0] += col * transform[1] + row * transform[2]
+    transform[3] += col * transform[4] + row * transform[5]
+    return tuple(transform)
+
+
+def _gis_order(srs):
+    srs = srs.Clone()
+    if hasattr(osr, "OAMS_TRADITIONAL_GIS_ORDER"):
+        # GDAL >= 3 uses the axis order of the authority by default.
+        srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    return srs
+
+
+def _transform_envelope(envelope, src, dst, points=21):
+    """Transform ``[left, right, bottom, top]`` between spatial references.
+
+    Points along the edges are transformed too, so the result covers
+    edges which are curved in ``dst``.
+    """
+    left, right, bottom, top = envelope
+    t = np.linspace(0, 1, points)
+    xs = np.concatenate([left + (right - left) * t, np.full(points, right),
+                         right - (right - left) * t, np.full(points, left)])
+    ys = np.concatenate([np.full(points, bottom), bottom + (top - bottom) * t,
+                         np.full(points, top), top - (top - bottom) * t])
+    transformation = osr.CoordinateTransformation(
+        _gis_order(src), _gis_order(dst))
+    coords = np.array(transformation.TransformPoints(
+        np.column_stack([xs, ys]).tolist()), np.float64)[:, :2]
+    coords = coords[np.isfinite(coords).all(axis=1)]
+    if not len(coords):
+        raise ValueError(
+            "Envelope {} can not be transformed.".format(envelope))
+    (x0, y0), (x1, y1) = coords.min(axis=0), coords.max(axis=0)
+    return float(x0), float(x1), float(y0), float(y1)
+
+
+def _envelope(extent, projection=None):
+    """Get ``[left, right, bottom, top]`` of an extent or a vector.
+
+    The envelope of a vector is transformed into ``projection`` (WKT) when
+    the vector has another spatial reference. Plain extents should be in
+    ``projection`` already.
     """
+    if isinstance(extent, str):
+        # Keep the datasource while its layer is used.
+        shp = ogr.Open(extent)
+        return _envelope(shp.GetLayer(), projection)
+    if isinstance(extent, ogr.Layer):
+        srs = extent.GetSpatialRef()
+        envelope = extent.GetExtent()
+    else:
+        if isinstance(extent, ogr.Feature):
+            extent = extent.GetGeometryRef()
+        if not isinstance(extent, ogr.Geometry):
+            return tuple(extent)
+        srs = extent.GetSpatialReference()
+        envelope = extent.GetEnvelope()
+
+    if srs is None or not projection:
+        return tuple(envelope)
+    target = _wkt_to_srs(projection)
+    if srs.IsSame(target):
+        return tuple(envelope)
+    return _transform_envelope(envelope, srs, target)
+
+
+def _extent_to_window(transform, xsize, ysize, extent, projection=None):
+    """Convert an extent into the smallest pixel window covering it.
+
+    Vectors are transformed into ``projection`` first, see
+    :func:`_envelope`.
+
+    Returns:
+        tuple: ``(xoff, yoff, xsize, ysize)`` clipped to the raster.
+
+    Raises:
+        ValueError: The extent does not overlap the raster.
+    """
+    left, right, bottom, top = _envelope(extent, projection)
+    inv_transform = gdal.InvGeoTransform(transform)
+    corners = np.array([
+        gdal.ApplyGeoTransform(inv_transform, x, y)
+        for x in (left, right) for y in (bottom, top)
+    ])
+    # Ignore floating point noise on the pixel edges.
+    corners = np.round(corners, 6)
+    x0, y0 = np.floor(corners.min(axis=0)).astype(int)
+    x1, y1 = np.ceil(corners.max(axis=0)).astype(int)
+    x0, x1 = max(x0, 0), min(x1, xsize)
+    y0, y1 = max(y0, 0), min(y1, ysize)
+    if x0 >= x1 or y0 >= y1:
+        raise ValueError(
+            "Extent {} is outside of the raster.".format(
+                (left, right, bottom, top)))
+    return int(x0), int(y0), int(x1 - x0), int(y1 - y0)
+
+
+def _world_to_pixel(transform, x, y):
+    """Convert coordinates into fractional ``(row, col)`` pixel positions.
+    """
+    x = np.asarray(x, np.float64)
+    y = np.asarray(y, np.float64)
+    det = transform[1] * transform[5] - transform[2] * transform[4]
+    dx = x - transform[0]
+    dy = y - transform[3]
+    col = (transform[5] * dx - transform[2] * dy) / det
+    row = (transform[1] * dy - transform[4] * dx) / det
+    return row, col
+
+
+def _points(x, y=None):
+    """Get coordinate arrays of points.
+
+    ``x`` could be an :class:`ogr.Layer` or a vector file path of points,
+    when ``y`` is ``None``.
+    """
+    if y is not None:
+        return np.ravel(x), np.ravel(y)
+
+    if isinstance(x, str):
+        shp = ogr.Open(x)
+        layer = shp.GetLayer()
+    else:
+        layer = x
+    xs, ys = [], []
+    layer.ResetReading()
+    for feature in layer:
+        geometry = feature.GetGeometryRef()
+        xs.append(geometry.GetX())
+        ys.append(geometry.GetY())
+    layer.ResetReading()
+    return np.array(xs, np.float64), np.array(ys, np.float64)
+
+
+def _sample(array, row, col, method="nearest"):
+    """Sample a (masked) 2D array at fractional pixel positions.
+
+    Returns:
+        :class:`numpy.ma.MaskedArray`, masked where the point is outside of
+        the array or on masked pixels.
+    """
+    data = np.ma.getdata(array)
+    mask = np.ma.getmaskarray(array)
+    ysize, xsize = data.shape
+    inside = (row >= 0) & (row < ysize) & (col >= 0) & (col < xsize)
+
+    if method == "nearest":
+        r = np.where(inside, row, 0).astype(np.intp)
+        c = np.where(inside, col, 0).astype(np.intp)
+        return np.ma.masked_array(data[r, c], ~inside | mask[r, c])
+
+    if method != "bilinear":
+        raise ValueError("Unknown sample method {!r}.".format(method))
+
+    # Interpolate between pixel centres, masked pixels get no weight.
+    row = np.where(inside, row, 0.5) - 0.5
+    col = np.where(inside, col, 0.5) - 0.5
+    r0 = np.floor(row).astype(np.intp)
+    c0 = np.floor(col).astype(np.intp)
+    fr = row - r0
+    fc = col - c0
+
+    total = np.zeros(row.shape, np.float64)
+    weights = np.zeros(row.shape, np.float64)
+    for dr, wr in ((0, 1 - fr), (1, fr)):
+        for dc, wc in ((0, 1 - fc), (1, fc)):
+            r = np.clip(r0 + dr, 0, ysize - 1)
+            c = np.clip(c0 + dc, 0, xsize - 1)
+            w = np.where(mask[r, c], 0, wr * wc)
+            total += w * np.where(mask[r, c], 0, data[r, c])
+            weights += w
+    with np.errstate(invalid="ignore", divide="ignore"):
+        values = total / weights
+    return np.ma.masked_array(values, ~inside | (weights == 0))
+
+
+# Number of elements checked at a time when building masks.
+_MASK_BLOCK = 2 ** 18
+
+
+def _build_mask(data, masks, nodatavalue=None, check_invalid=True):
+    """Mask invalid values, nodata and given masks in one blocked pass.
+
+    Args:
+        data (numpy.ndarray): Pixel values.
+        masks (list): Masks to combine, ``nomask`` entries are ignored.
+        nodatavalue: Mask pixels equal to it.
+        check_invalid (bool): Mask NaN and inf. Skipped for integer data.
+
+    Returns:
+        A boolean array, or ``nomask`` when no pixel is masked.
+    """
+    check_invalid = check_invalid and data.dtype.kind in "fc"
+    masks = [
+        np.broadcast_to(np.asarray(m, bool), data.shape) for m in masks
+        if m is not np.ma.nomask and m is not None and m is not False
+    ]
+    if not (check_invalid or nodatavalue is not None or masks):
+        return np.ma.nomask
+    shape = data.shape
+    if data.ndim == 0:
+        data = data.reshape(1)
+        masks = [m.reshape(1) for m in masks]
+
+    mask = np.zeros(data.shape, bool)
+    row_size = max(int(np.prod(data.shape[1:])), 1)
+    step = max(_MASK_BLOCK // row_size, 1)
+    masked = False
+    for top in range(0, data.shape[0], step):
+        d = data[top:top + step]
+        m = mask[top:top + step]
+        if check_invalid:
+            np.isfinite(d, out=m)
+            np.logical_not(m, out=m)
+        if nodatavalue is not None:
+            m |= d == nodatavalue
+        for given in masks:
+            m |= given[top:top + step]
+        masked = masked or m.any()
+    return mask.reshape(shape) if masked else np.ma.nomask
+
+
+class Raster(MaskedArray):
+    """A masked array with geographic metadata.
+
+    Args:
+        array (array_like): Pixel values. An ndarray is used without copying
+            unless ``copy=True``.
+        transform (list): GDAL geotransform.
+        projection (str): WKT of the projection. Use ``a_srs`` by default.
+        a_srs (str): Authority code of the projection, e.g. ``EPSG:4326``.
+        nodatavalue: Pixels equal to it are masked.
+        mask (array): Extra mask, combined with the mask of ``array``.
+        filepath (str): Source file path.
+        copy (bool): Copy ``array``.
+        check_invalid (bool): Mask NaN and inf. Skip it for data known to
+            be finite.
+
+    The mask is built in one pass over the data. No mask array is allocated
+    when no pixel is masked.
     """
     def __new__(cls, array, transform, projection=None, a_srs="EPSG:4326",
-                nodatavalue=None, mask=None, filepath=None):
+                nodatavalue=None, mask=None, filepath=None, copy=False,
+                check_invalid=True):
         """"""
         projection = projection or _srs_to_wkt(a_srs)
 
@@ -51,16 +339,12 @@ class Raster(MaskedArray):
             'transform': tuple(transform),
         }
 
-        array = np.ma.masked_invalid(array)
-
-        if mask is not None:
-            array = MaskedArray(array, mask=mask)
-
-        if nodatavalue is not None:
-            array = np.ma.masked_equal(array, nodatavalue)
+        data = np.ma.getdata(array)
+        mask = _build_mask(
+            data, [np.ma.getmask(array), mask], nodatavalue, check_invalid)
 
         obj = super(Raster, cls).__new__(
-            cls, array, fill_value=nodatavalue
+            cls, data, mask=mask, fill_value=nodatavalue, copy=copy
         )
 
         if filepath is not None:
@@ -99,9 +383,9 @@ class Raster(MaskedArray):
         [left, right, bottom, top]
         """
         left = self.transform[0]
-        right = left + self.transform[1] * self.shape[1]
+        right = left + self.transform[1] * self.shape[-1]
         top = self.transform[3]
-        bottom = top + self.transform[5] * self.shape[0]
+        bottom = top + self.transform[5] * self.shape[-2]
         return left, right, bottom, top
 
     def _gdal_dtype(self):
@@ -127,6 +411,25 @@ class Raster(MaskedArray):
         y = int((y - origin_y) / pixel_y)
         return self[x, y]
 
+    def sample(self, x, y=None, method="nearest"):
+        """Get values of many points at once.
+
+        Args:
+            x (array or str or ogr.Layer): The X coordinates of points. Or a
+                point layer / vector file path when ``y`` is ``None``.
+            y (array): The Y coordinates of points.
+            method (str):
+                |  Could be following options:
+                |  ``nearest`` (default) Value of the pixel under the point
+                |  ``bilinear`` Interpolate between valid pixel centres
+
+        Returns:
+            :class:`numpy.ma.MaskedArray`: One value per point, masked for
+            points outside of the raster or on nodata.
+        """
+        row, col = _world_to_pixel(self.transform, *_points(x, y))
+        return _sample(self, row, col, method)
+
     def set_fill_value(self, value=None):
         """Set fill value.
 
@@ -135,15 +438,17 @@ class Raster(MaskedArray):
                 of current dtype will be used when this argument is greater
                 or lower than current dtype's range.
         """
-        info = np.iinfo if self.dtype.kind == "i" else np.finfo
-        max_value = info(self.dtype).max
-        min_value = info(self.dtype).min
         value = self.fill_value if value is None else value
-        value = np.median([max_value, min_value, value])
+        if self.dtype.kind in "iufc":
+            info = np.iinfo if self.dtype.kind in "iu" else np.finfo
+            max_value = info(self.dtype).max
+            min_value = info(self.dtype).min
+            value = np.median([max_value, min_value, value])
         super(Raster, self).set_fill_value(value)
 
     def save(self, out_path=None, driver_name="GTiff",
-             compress=True, options=None):
+             compress=True, options=None, overviews=None,
+             resampling="nearest", profile=None, blocksize=512, level=None):
         """save :class:`Raster` to GeoTIFF file or :class:`gdal.Dataset`.
 
         Args:
@@ -160,14 +465,26 @@ class Raster(MaskedArray):
                 |  ``compress='DEFAULT'``
                 |  ``compress='PACKBITS'``
                 |  ... other algorithms gdal supported
+            overviews (bool or list): Build internal overviews. See
+                :func:`gkit.io.save`.
+            resampling (str): Resampling method of the overviews.
+            profile (str): ``tiled`` or ``cog`` output. See
+                :func:`gkit.io.save`.
+            blocksize (int): Tile size of a profile.
+            level (int): Compression level of a profile.
 
         Returns:
             `None` or `gdal.Dataset`
         """
-        return gk.save(self, out_path, driver_name, compress, options)
+        return gk.save(self, out_path, driver_name, compress, options,
+                       overviews, resampling, profile, blocksize, level)
+
+    def layer_mask(self, layer):
+        """Rasterize layer on the grid of raster.
 
-    def clip_by_layer(self, layer):
-        """Clip raster by layer."""
+        Returns:
+            numpy.ndarray: Boolean mask, ``True`` outside of the layer.
+        """
 
         # TODO Convert layer's projection into raster's projection when
         # they have different projection.
@@ -182,29 +499,91 @@ class Raster(MaskedArray):
 
         gdal.RasterizeLayer(tmp_raster, [1], layer, burn_values=[1])
 
-        mask = np.ma.masked_equal(
-            tmp_raster.ReadAsArray(), 0).mask
+        return tmp_raster.ReadAsArray() == 0
 
+    def clip_by_mask(self, mask):
+        """Mask pixels where ``mask`` is ``True``.
+
+        The result is a copy, it does not share pixels with the raster.
+        """
         array = np.ma.masked_array(self, mask)
-        return Raster(array, self.transform, self.projection)
+        return Raster(array, self.transform, self.projection, copy=True)
+
+    def window(self, xoff, yoff, xsize, ysize):
+        """Get a pixel window as :class:`Raster` without copying pixels."""
+        array = self.view(MaskedArray)[yoff:yoff + ysize, xoff:xoff + xsize]
+        r = Raster(array, _window_transform(self.transform, yoff, xoff),
+                   self.projection, filepath=self.filepath,
+                   check_invalid=False)
+        r.set_fill_value(self.fill_value)
+        return r
+
+    def _crop(self, layer):
+        """Get the window covering the envelope of ``layer``.
+
+        Raises:
+            ValueError: ``layer`` does not overlap the raster.
+        """
+        return self.window(*_extent_to_window(
+            self.transform, self.shape[1], self.shape[0], layer,
+            self.projection))
+
+    def clip_by_layer(self, layer, crop=False):
+        """Clip raster by layer.
 
-    def clip_by_shp(self, shp_path):
-        """Clip raster by shapefile."""
+        Args:
+            layer (ogr.Layer): Polygons.
+            crop (bool): Only rasterize and return the window covering the
+                envelope of ``layer``, instead of a full size raster.
+                The envelope is transformed into the projection of the
+                raster.
+
+        Raises:
+            ValueError: ``crop=True`` and ``layer`` does not overlap the
+                raster.
+        """
+        raster = self._crop(layer) if crop else self
+        return raster.clip_by_mask(raster.layer_mask(layer))
+
+    def clip_by_shp(self, shp_path, where=None, cache=None, crop=False):
+        """Clip raster by shapefile.
+
+        Args:
+            shp_path (str): Shapefile path.
+            where (str): Attribute filter, only use matched features.
+            cache (MaskCache): Reuse the rasterized mask for rasters on the
+                same grid.
+            crop (bool): Only return the window covering the envelope of the
+                shapefile. See :meth:`clip_by_layer`.
+        """
         shp = ogr.Open(shp_path)
-        return self.clip_by_layer(shp.GetLayer())
+        layer = shp.GetLayer()
+        if where is not None:
+            layer.SetAttributeFilter(where)
+
+        raster = self._crop(layer) if crop else self
+        if cache is None or not raster.size:
+            return raster.clip_by_layer(layer)
+        return raster.clip_by_mask(cache.get(
+            cache.key(shp_path, raster, layer, where),
+            lambda: raster.layer_mask(layer)))
 
-    def clip_by_feature(self, feature):
-        """Clip raster by on or more features."""
+    def clip_by_feature(self, feature, crop=False):
+        """Clip raster by on or more features.
+
+        Args:
+            feature (ogr.Feature or list): Features.
+            crop (bool): See :meth:`clip_by_layer`.
+        """
         feature = [feature] if isinstance(feature, ogr.Feature) else feature
         mem_shp_driver = ogr.GetDriverByName("Memory")
         tmp_shp = mem_shp_driver.CreateDataSource("")
-        srs = osr.SpatialReference()
-        srs.ImportFromWkt(self.projection)
-        tmp_layer = tmp_shp.CreateLayer("tmp", srs)
+        tmp_layer = tmp_shp.CreateLayer(
+            "tmp", _wkt_to_srs(self.projection))
         for f in feature:
             tmp_layer.CreateFeature(f.Clone())
 
-        return self.clip_by_layer(tmp_layer)
+        return self.clip_by_layer(tmp_layer, crop)
 
     def clip_by_extent(self, extent):
         """Clip raster by extent.
@@ -213,7 +592,7 @@ class Raster(MaskedArray):
             extent (tuple or list): [left, right, bottom, top]
 
         Returns:
-            `None` or `gdal.Dataset`
+            :class:`Raster`, a copy of the pixels.
         """
         extent = list(extent)
         if self.transform[1] < 0:
@@ -227,25 +606,37 @@ class Raster(MaskedArray):
             (extent[2] - self.transform[3]) / self.transform[5],
             (extent[3] - self.transform[3]) / self.transform[5],
         ]).astype(int)
-        raster = self[index[3]:index[2], index[0]:index[1]]
+        array = self.view(MaskedArray)[index[3]:index[2], index[0]:index[1]]
         transform = list(self.transform)
         transform[0] = index[0] * self.transform[1] + self.transform[0]
         transform[3] = index[3] * self.transform[5] + self.transform[3]
-        raster.transform = transform
+        raster = Raster(array, transform, self.projection,
+                        filepath=self.filepath, copy=True,
+                        check_invalid=False)
+        raster.set_fill_value(self.fill_value)
         return raster
 
-    def split_by_shp(self, shp, by=None, overall=False):
-        return gk.split_by_shp(self, shp, by, overall)
+    def split_by_shp(self, shp, by=None, overall=False, crop=False):
+        return gk.split_by_shp(self, shp, by, overall, crop)
 
     def zonal_apply(self, shp_path, func, by=None, overall=False,
-                    args=(), kwargs={}):
-        return gk.zonal_apply(self, shp_path, func, by, overall, args, kwargs)
+                    args=(), kwargs={}, executor=None, workers=None):
+        return gk.zonal_apply(self, shp_path, func, by, overall, args, kwargs,
+                              executor, workers)
+
+    def zonal_stats(self, shp_path, stats=("count", "mean", "min", "max"),
+                    by=None, overall=False):
+        return gk.zonal_stats(self, shp_path, stats, by, overall)
 
     def reproject(self, x_count=None, y_count=None,
                   transform=None, projection=None, a_srs=None,
-                  method=gdal.GRA_Bilinear):
+                  method=gdal.GRA_Bilinear, num_threads="ALL_CPUS",
+                  warp_memory=None):
         """Reproject/Resample
 
+        Use the multithreaded ``gdal.Warp``. To reproject many rasters on
+        the same grid, see :class:`gkit.core.warp.WarpPlan`.
+
         Args:
             x_count (int): Row count. (``RasterXSize``)
             y_count (int): Column count. (``RasterYSize``)
@@ -259,10 +650,14 @@ class Raster(MaskedArray):
                 |  ``gdal.GRA_CubicSpline``
                 |  ``gdal.GRA_Lanczos``
                 |  ``gdal.GRA_NearestNeighbour``
+            num_threads (int or str): Threads of the warper, ``None`` to
+                use one thread. (default="ALL_CPUS")
+            warp_memory (int): Memory limit of the warper in MB.
 
         Returns:
             :class:`Raster`
         """
+        method = gdal.GRA_Bilinear if method is None else method
         x_count = x_count or self.shape[1]
         y_count = y_count or self.shape[0]
         transform = transform or self.transform
@@ -282,9 +677,16 @@ class Raster(MaskedArray):
         tmp_band.SetNoDataValue(np.float64(self.fill_value))
         tmp_band.Fill(np.float64(self.fill_value))
 
-        gdal.ReprojectImage(
-            self.save(), tmp_raster,
-            self.projection, projection, method)
+        gdal.Warp(tmp_raster, self.save(), options=gdal.WarpOptions(
+            resampleAlg=method,
+            multithread=num_threads is not None,
+            warpOptions=(
+                ["NUM_THREADS={}".format(num_threads)]
+                if num_threads is not None else None),
+            warpMemoryLimit=warp_memory,
+            srcNodata=np.float64(self.fill_value),
+            dstNodata=np.float64(self.fill_value),
+        ))
 
         array = tmp_band.ReadAsArray()
 
@@ -335,13 +737,24 @@ class Raster(MaskedArray):
         self.plot(*args, **kwargs)
 
     def rolling(self, function, size=None, footprint=None, mode='reflect',
-                cval=0.0):
+                cval=0.0, jit=False):
         """Calculate a 2D filter using the given function.
 
         At each element the provided function is called. The input values
         within the filter footprint at that element are passed to the function
         as a 1D array of double values.
 
+        Built-in reducers (``"mean"``, ``"sum"``, ``"min"``, ``"max"``,
+        ``"std"``, ``"median"``, ``"count"`` or the numpy functions like
+        ``np.mean``) are calculated by vectorized filters instead. They
+        exclude masked pixels from the window, and ``"count"`` (only as a
+        string) gives the number of valid pixels of the raster in the
+        window, the padding of ``mode='constant'`` is not counted.
+
+        Other functions could be compiled into native code with ``numba``
+        (see ``jit``). A ``numba.njit`` function or a
+        :class:`scipy.LowLevelCallable` is used as native code directly.
+
         Args:
             function (callable, str): Function to apply at each element.
             size (scalar, tuple): See foorprint, below.
@@ -376,10 +789,22 @@ class Raster(MaskedArray):
                     by wrapping around to the opposite edge.
             cval (scalar): Value to fill past edges of input if `mode` is
                 'constant'. Default is 0.0.
+            jit (bool): Compile `function` with ``numba``. Fall back to
+                the Python function when ``numba`` is not installed.
 
         Returns:
             :class:`Raster`
         """
+        name = reducer_name(function)
+        if name is not None:
+            res, count = rolling_reduce(
+                self, name, size, footprint, mode=mode, cval=cval)
+            return Raster(res, self.transform, self.projection,
+                          mask=self.mask | (count == 0))
+
+        if jit or is_jitted(function):
+            function = compile_kernel(function)
+
         res = gf(
             self.filled(np.nan), function, size, footprint,
             mode=mode, cval=cval)
@@ -389,7 +814,6 @@ class Raster(MaskedArray):
         return self.__repr__()
 
     def __repr__(self):
-        projection_name = osr.SpatialReference(
-            wkt=self.projection).GetAttrValue('geogcs')
+        projection_name = _projection_name(self.projection)
         return "Raster<{}, {}, {}>".format(
             projection_name, self.shape, self.extent)
@@ -0,0 +1,206 @@
+"""Vectorized kernels for :meth:`Raster.rolling`.
+
+Common reducers are calculated with whole-array filters instead of calling
+a Python function at every pixel. Masked pixels are excluded from the
+window, so the result is like applying ``numpy.nanmean`` etc.
+
+Other window functions can be compiled into native callbacks of
+``scipy.ndimage.generic_filter`` when ``numba`` is installed.
+"""
+import warnings
+
+import numpy as np
+from scipy import LowLevelCallable, ndimage
+
+try:
+    import numba
+    from numba import types
+except ImportError:
+    numba = None
+
+
+REDUCERS = ("mean", "sum", "min", "max", "std", "median", "count")
+
+_ALIASES = {
+    np.mean: "mean", np.nanmean: "mean", np.ma.mean: "mean",
+    np.sum: "sum", np.nansum: "sum", np.ma.sum: "sum",
+    np.min: "min", np.amin: "min", np.nanmin: "min", np.ma.min: "min",
+    np.max: "max", np.amax: "max", np.nanmax: "max", np.ma.max: "max",
+    np.std: "std", np.nanstd: "std", np.ma.std: "std",
+    np.median: "median", np.nanmedian: "median", np.ma.median: "median",
+}
+
+# Boundary modes of ``scipy.ndimage`` and their ``numpy.pad`` names.
+_PAD_MODES = {
+    "reflect": "symmetric",
+    "mirror": "reflect",
+    "nearest": "edge",
+    "wrap": "wrap",
+    "constant": "constant",
+}
+
+# Upper limit of window elements held at once by the median kernel.
+_CHUNK_ELEMENTS = 2 ** 24
+
+
+def reducer_name(function):
+    """Get the name of a built-in reducer.
+
+    Args:
+        function (callable or str): A name in :data:`REDUCERS` or a numpy
+            function like ``np.mean``.
+
+    Returns:
+        str or ``None`` if ``function`` is not a built-in reducer.
+    """
+    if isinstance(function, str):
+        if function not in REDUCERS:
+            raise ValueError(
+                "Unknown reducer {!r}. Use one of {}.".format(
+                    function, ", ".join(REDUCERS)))
+        return function
+    try:
+        return _ALIASES.get(function)
+    except TypeError:
+        # Unhashable callable.
+        return None
+
+
+def _footprint(size, footprint, ndim):
+    if footprint is not None:
+        return np.asarray(footprint, bool)
+    size = np.broadcast_to(size, ndim) if np.ndim(size) == 0 else size
+    return np.ones(tuple(int(s) for s in size), bool)
+
+
+def _window_sum(array, footprint, mode, cval):
+    if footprint.all():
+        return ndimage.uniform_filter(
+            array, footprint.shape, mode=mode, cval=cval) * footprint.size
+    return ndimage.correlate(
+        array, footprint.astype(np.float64), mode=mode, cval=cval)
+
+
+def _median(array, footprint, mode, cval):
+    """Median of the valid (non NaN) values in every window."""
+    before = [s // 2 for s in footprint.shape]
+    pad = [(b, s - 1 - b) for b, s in zip(before, footprint.shape)]
+    kwargs = {"constant_values": cval} if mode == "constant" else {}
+    padded = np.pad(array, pad, _PAD_MODES[mode], **kwargs)
+
+    res = np.empty(array.shape, np.float64)
+    rows = max(1, _CHUNK_ELEMENTS // (array.shape[1] * footprint.sum()))
+    for top in range(0, array.shape[0], rows):
+        chunk = padded[top:top + rows + footprint.shape[0] - 1]
+        windows = np.lib.stride_tricks.sliding_window_view(
+            chunk, footprint.shape)[..., footprint]
+        with np.errstate(invalid="ignore"):
+            res[top:top + rows] = np.nanmedian(windows, axis=-1)
+    return res
+
+
+def rolling_reduce(array, name, size=None, footprint=None,
+                   mode="reflect", cval=0.0):
+    """Calculate a built-in reducer in every window.
+
+    Args:
+        array (numpy.ma.MaskedArray): Input array.
+        name (str): Reducer name, see :data:`REDUCERS`.
+        size, footprint, mode, cval: See :meth:`Raster.rolling`.
+
+    Returns:
+        tuple: ``(result, count)``. ``count`` is the number of valid pixels
+        in every window (``cval`` padding included, except for the
+        ``count`` reducer), ``result`` is undefined where it is ``0``.
+    """
+    if mode not in _PAD_MODES:
+        raise ValueError("Unknown mode {!r}.".format(mode))
+    footprint = _footprint(size, footprint, np.ndim(array))
+
+    valid = ~np.ma.getmaskarray(array)
+    data = np.ma.getdata(array).astype(np.float64)
+    data[~valid] = 0
+
+    if name == "count":
+        # The padding of ``constant`` mode is not a pixel of the raster.
+        count = np.rint(_window_sum(
+            valid.astype(np.float64), footprint, mode, 0.0)).astype(np.intp)
+        return count, count
+
+    # Pixels beyond the edges are valid values in ``constant`` mode.
+    count = np.rint(_window_sum(
+        valid.astype(np.float64), footprint, mode, 1.0)).astype(np.intp)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if name in ("sum", "mean", "std"):
+            # Center values to keep the variance accurate.
+            offset = data[valid].mean() if valid.any() else 0.
+            centered = np.where(valid, data - offset, 0)
+            total = _window_sum(centered, footprint, mode, cval - offset)
+            if name == "sum":
+                res = total + offset * count
+            elif name == "mean":
+                res = total / count + offset
+            else:
+                square = _window_sum(
+                    centered * centered, footprint, mode,
+                    (cval - offset) ** 2)
+                res = np.sqrt(np.maximum(
+                    square / count - (total / count) ** 2, 0))
+                res[count == 1] = 0
+        elif name in ("min", "max"):
+            if name == "min":
+                data[~valid] = np.inf
+                res = ndimage.minimum_filter(
+                    data, footprint=footprint, mode=mode, cval=cval)
+            else:
+                data[~valid] = -np.inf
+                res = ndimage.maximum_filter(
+                    data, footprint=footprint, mode=mode, cval=cval)
+        else:
+            data[~valid] = np.nan
+            res = _median(data, footprint, mode, cval)
+    return res, count
+
+
+def is_jitted(function):
+    """Whether ``function`` is already compiled by ``numba.njit``."""
+    return numba is not None and \
+        isinstance(function, numba.core.registry.CPUDispatcher)
+
+
+def compile_kernel(function):
+    """Compile a window function into a native ``generic_filter`` callback.
+
+    ``function`` receives the window values as a 1D float64 array and
+    returns a float, it must be supported by ``numba.njit``.
+
+    Args:
+        function (callable): Python function or ``numba.njit`` function.
+
+    Returns:
+        :class:`scipy.LowLevelCallable`, or ``function`` itself with a
+        warning when ``numba`` is not installed or cannot compile it.
+    """
+    if isinstance(function, LowLevelCallable):
+        return function
+    if numba is None:
+        warnings.warn("numba is not installed, use the Python function.")
+        return function
+
+    try:
+        jitted = function if is_jitted(function) else numba.njit(function)
+
+        @numba.cfunc(types.intc(
+            types.CPointer(types.float64), types.intp,
+            types.CPointer(types.float64), types.voidptr))
+        def kernel(values_ptr, size, result, user_data):
+            values = numba.carray(values_ptr, (size,), types.float64)
+            result[0] = jitted(values)
+            return 1
+    except Exception as e:
+        warnings.warn(
+            "Cannot compile {!r} ({}), use the Python function.".format(
+                function, e))
+        return function.py_func if is_jitted(function) else function
+    return LowLevelCallable(kernel.ctypes)
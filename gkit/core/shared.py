@@ -0,0 +1,76 @@
+"""Numpy arrays in shared memory, used to hand large arrays to worker
+processes without pickling them.
+"""
+import weakref
+from collections import OrderedDict
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+# Blocks attached by this process, by name.
+_ATTACHED = OrderedDict()
+_MAX_ATTACHED = 64
+# Arrays returned by attach, by block name. Closing a block under a live
+# array would crash the process, views do not keep it from closing.
+_ARRAYS = {}
+
+
+def share(array):
+    """Copy ``array`` into a new shared memory block.
+
+    Returns:
+        tuple: ``(block, spec)``. Call ``block.close()`` and
+        ``block.unlink()`` when the workers are done. ``spec`` is a small
+        picklable description for :func:`attach`.
+    """
+    array = np.ascontiguousarray(array)
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+    return block, (block.name, array.shape, array.dtype.str)
+
+
+def attach(spec):
+    """Get the array described by ``spec`` without copying (read only)."""
+    name, shape, dtype = spec
+    if name not in _ATTACHED:
+        try:
+            block = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python < 3.13. Pool workers share the resource tracker of the
+            # parent process, which unlinks the block.
+            block = shared_memory.SharedMemory(name=name)
+        _ATTACHED[name] = block
+        _ARRAYS[name] = []
+        for old in list(_ATTACHED)[:len(_ATTACHED) - _MAX_ATTACHED]:
+            _close(old)
+    _ATTACHED.move_to_end(name)
+    array = np.ndarray(shape, np.dtype(dtype), buffer=_ATTACHED[name].buf)
+    array.flags.writeable = False
+    _ARRAYS[name] = [r for r in _ARRAYS[name] if r() is not None]
+    _ARRAYS[name].append(weakref.ref(array))
+    return array
+
+
+def _close(name):
+    """Close an attached block unless an array still uses it."""
+    if any(r() is not None for r in _ARRAYS[name]):
+        return
+    _ATTACHED.pop(name).close()
+    del _ARRAYS[name]
+
+
+def detach(names):
+    """Close blocks attached by this process, e.g. at the end of a task in
+    a long-lived worker. Blocks still used by an array stay attached.
+    """
+    for name in names:
+        if name in _ATTACHED:
+            _close(name)
+
+
+def release(blocks):
+    """Close and unlink shared memory blocks."""
+    for block in blocks:
+        block.close()
+        block.unlink()
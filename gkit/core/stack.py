@@ -0,0 +1,123 @@
+"""Multi-band rasters as one 3-D array."""
+import numpy as np
+
+from .raster import Raster
+
+
+class RasterStack(Raster):
+    """Bands of a raster as one ``(bands, rows, cols)`` masked array.
+
+    All bands share one transform, projection and a contiguous buffer, so
+    operations across bands are vectorized numpy operations.
+
+    Args:
+        array (array_like): 3-D array ``(bands, rows, cols)``.
+        transform (list): GDAL geotransform.
+        nodatavalue: Nodata value of all bands, or a list with one value
+            per band (``None`` or ``nan`` for a band without nodata).
+
+    Other arguments are the same as :class:`Raster`.
+    """
+    def __new__(cls, array, transform, projection=None, a_srs="EPSG:4326",
+                nodatavalue=None, mask=None, filepath=None, copy=False,
+                check_invalid=True):
+        if np.ndim(array) != 3:
+            raise ValueError(
+                "RasterStack needs a 3-D array, got {} dimensions.".format(
+                    np.ndim(array)))
+
+        band_nodata = None
+        if np.ndim(nodatavalue):
+            # Different nodata values, mask each band on its own.
+            band_nodata = [np.nan if v is None else float(v)
+                           for v in nodatavalue]
+            nodata = np.array(band_nodata, np.float64)
+            band_mask = np.ma.getdata(array) == nodata[:, None, None]
+            mask = band_mask if mask is None else band_mask | mask
+            nodatavalue = None
+
+        obj = super(RasterStack, cls).__new__(
+            cls, array, transform, projection, a_srs, nodatavalue, mask,
+            filepath, copy, check_invalid)
+        obj._band_nodata = band_nodata
+        return obj
+
+    def _update_from(self, obj):
+        self.__dict__["_band_nodata"] = getattr(obj, "_band_nodata", None)
+        super(RasterStack, self)._update_from(obj)
+
+    @classmethod
+    def from_rasters(cls, rasters):
+        """Stack rasters on the same grid."""
+        rasters = list(rasters)
+        for r in rasters[1:]:
+            if r.shape != rasters[0].shape or \
+                    r.transform != rasters[0].transform:
+                raise ValueError("Rasters are not on the same grid.")
+        fill_values = [r.fill_value for r in rasters]
+        stack = cls(np.ma.stack(rasters), rasters[0].transform,
+                    rasters[0].projection, filepath=rasters[0].filepath)
+        stack.set_fill_value(fill_values[0])
+        if len(set(fill_values)) > 1:
+            stack._band_nodata = [float(v) for v in fill_values]
+        return stack
+
+    @property
+    def band_count(self):
+        """Number of bands."""
+        return self.shape[0]
+
+    def band_nodata(self):
+        """Nodata value of each band, used to fill masked pixels when
+        saving. Bands without their own nodata value use the fill value.
+        """
+        self.set_fill_value()  # Make sure fill value is correct.
+        values = self._band_nodata
+        if values is None or len(values) != self.shape[0]:
+            return [self.fill_value] * self.shape[0]
+        return [
+            self.fill_value if np.isnan(v) and self.dtype.kind not in "fc"
+            else v for v in values
+        ]
+
+    def filled_bands(self):
+        """Like :meth:`filled`, with the nodata value of each band."""
+        nodata = np.array(self.band_nodata()).astype(self.dtype)
+        return np.where(np.ma.getmaskarray(self), nodata[:, None, None],
+                        np.ma.getdata(self))
+
+    def band(self, i):
+        """Get a band (starting from 0) as :class:`Raster` without copying.
+        """
+        r = Raster(self.view(np.ma.MaskedArray)[i], self.transform,
+                   self.projection, filepath=self.filepath,
+                   check_invalid=False)
+        r.set_fill_value(self.band_nodata()[i])
+        return r
+
+    def to_list(self):
+        """Split into a list of :class:`Raster`, one per band."""
+        return [self.band(i) for i in range(self.shape[0])]
+
+    def reduce(self, func, *args, **kwargs):
+        """Reduce all bands into one :class:`Raster` pixel by pixel.
+
+        Args:
+            func (function): Function accepting ``axis``, e.g.
+                ``np.ma.mean``, ``np.ma.argmax``.
+        """
+        array = func(self.view(np.ma.MaskedArray), *args, axis=0, **kwargs)
+        return Raster(array, self.transform, self.projection)
+
+    def normalized_difference(self, a, b):
+        """``(a - b) / (a + b)`` of two bands (starting from 0), e.g. NDVI.
+        """
+        a = self.view(np.ma.MaskedArray)[a].astype(np.float64)
+        b = self.view(np.ma.MaskedArray)[b].astype(np.float64)
+        return Raster((a - b) / (a + b), self.transform, self.projection)
+
+    def __repr__(self):
+        if self.ndim != 3:
+            return super(RasterStack, self).__repr__()
+        return "RasterStack<{} bands, {}, {}>".format(
+            self.shape[0], self.shape[1:], self.extent)
@@ -0,0 +1,119 @@
+"""Reusable warp plans.
+
+A :class:`WarpPlan` maps every pixel of a target grid to its position on a
+source grid once. Applying it to rasters on the source grid is only an
+array lookup, so reprojecting hundreds of same-grid rasters does not repeat
+the coordinate transformation.
+"""
+import numpy as np
+from osgeo import gdal, osr
+
+from .raster import Raster, _srs_to_wkt, _wkt_to_srs, _gis_order, \
+    _world_to_pixel, _sample
+
+
+# Rows of the target grid transformed at a time.
+_ROWS = 256
+
+_METHODS = {
+    gdal.GRA_NearestNeighbour: "nearest",
+    gdal.GRA_Bilinear: "bilinear",
+    "nearest": "nearest",
+    "bilinear": "bilinear",
+}
+
+
+class WarpPlan(object):
+    """Pixel mapping from a source grid to a target grid.
+
+    Args:
+        src_transform (list): Geotransform of the source grid.
+        src_shape (tuple): ``(rows, cols)`` of the source grid.
+        src_projection (str): WKT of the source grid.
+        transform (list): Geotransform of the target grid.
+        shape (tuple): ``(rows, cols)`` of the target grid.
+        projection (str): WKT of the target grid.
+        method:
+            |  Could be following options:
+            |  ``gdal.GRA_Bilinear`` or ``"bilinear"`` (default)
+            |  ``gdal.GRA_NearestNeighbour`` or ``"nearest"``
+    """
+    def __init__(self, src_transform, src_shape, src_projection,
+                 transform, shape, projection, method=gdal.GRA_Bilinear):
+        if method not in _METHODS:
+            raise ValueError(
+                "WarpPlan supports nearest and bilinear only, use "
+                ":meth:`Raster.reproject` for other methods.")
+        self.method = _METHODS[method]
+        self.src_transform = tuple(src_transform)
+        self.src_shape = tuple(src_shape)
+        self.src_projection = src_projection
+        self.transform = tuple(transform)
+        self.shape = tuple(shape)
+        self.projection = projection
+
+        transformation = None
+        if src_projection != projection:
+            transformation = osr.CoordinateTransformation(
+                _gis_order(_wkt_to_srs(projection)),
+                _gis_order(_wkt_to_srs(src_projection)))
+
+        self.row = np.empty(self.shape, np.float64)
+        self.col = np.empty(self.shape, np.float64)
+        cols = np.arange(self.shape[1]) + 0.5
+        for top in range(0, self.shape[0], _ROWS):
+            rows = np.arange(top, min(top + _ROWS, self.shape[0])) + 0.5
+            c, r = np.meshgrid(cols, rows)
+            # Centres of target pixels.
+            x = self.transform[0] + c * self.transform[1] + \
+                r * self.transform[2]
+            y = self.transform[3] + c * self.transform[4] + \
+                r * self.transform[5]
+            if transformation is not None:
+                points = np.array(transformation.TransformPoints(
+                    np.column_stack([x.ravel(), y.ravel()]).tolist()))
+                x = points[:, 0].reshape(r.shape)
+                y = points[:, 1].reshape(r.shape)
+            self.row[top:top + len(rows)], self.col[top:top + len(rows)] = \
+                _world_to_pixel(self.src_transform, x, y)
+
+    @classmethod
+    def from_raster(cls, raster, x_count=None, y_count=None,
+                    transform=None, projection=None, a_srs=None,
+                    method=gdal.GRA_Bilinear):
+        """Create a plan from the grid of ``raster``.
+
+        Arguments are the same as :meth:`Raster.reproject`.
+        """
+        x_count = x_count or raster.shape[1]
+        y_count = y_count or raster.shape[0]
+        transform = transform or raster.transform
+        if projection or a_srs:
+            projection = projection or _srs_to_wkt(a_srs)
+        else:
+            projection = raster.projection
+        return cls(raster.transform, raster.shape, raster.projection,
+                   transform, (y_count, x_count), projection, method)
+
+    def apply(self, raster):
+        """Warp rasters on the source grid.
+
+        Args:
+            raster (Raster or list of Raster): One or more rasters (bands).
+
+        Returns:
+            :class:`Raster` or a list of :class:`Raster`.
+        """
+        if not isinstance(raster, Raster):
+            return [self.apply(r) for r in raster]
+
+        if raster.shape != self.src_shape or \
+                raster.transform != self.src_transform:
+            raise ValueError("{!r} is not on the source grid.".format(raster))
+
+        values = _sample(raster, self.row, self.col, self.method)
+        if self.method == "nearest":
+            values = values.astype(raster.dtype)
+        res = Raster(values, self.transform, self.projection)
+        res.set_fill_value(raster.fill_value)
+        return res
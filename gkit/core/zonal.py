@@ -0,0 +1,627 @@
+"""Zonal statistics based on a single rasterized label grid.
+
+Every zone of a layer is burned into one integer label raster with a single
+``gdal.RasterizeLayer`` call. Pixels are then grouped by label once, so both
+the built-in reducers and per-zone views cost time proportional to the number
+of pixels instead of pixels × zones.
+
+A pixel belongs to one zone of the label grid only. The zones are burned
+twice in opposite orders to find pixels claimed by several zones; when
+zones overlap, a warning is issued and each zone is clipped by its own
+polygons instead, which is slower but exact.
+"""
+import os
+import re
+import warnings
+from concurrent.futures import Executor, ProcessPoolExecutor, \
+    ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+from osgeo import gdal, ogr
+
+from .raster import Raster, _window_transform
+from .shared import share, attach, detach, release
+
+
+#: Names of the built-in reducers. Percentiles are written as
+#: ``percentile_<q>``, e.g. ``percentile_90``.
+STATS = ("count", "sum", "mean", "min", "max", "std", "median")
+
+_PERCENTILE = re.compile(r"^percentile_(\d+(\.\d+)?)$")
+
+
+def _grid_key(raster):
+    """Rasters with the same key share one label grid."""
+    return raster.transform, raster.shape[-2:], raster.projection
+
+
+def _check_stat(stat):
+    if stat not in STATS and _PERCENTILE.match(stat) is None:
+        raise ValueError(
+            "Unknown zonal statistic {!r}. Use one of {} or "
+            "'percentile_<q>'.".format(stat, ", ".join(STATS)))
+
+
+def rasterize_zones(raster, layer, by=None):
+    """Burn all zones of a layer into one label grid.
+
+    Args:
+        raster (Raster): Provides the grid (shape, transform, projection).
+        layer (ogr.Layer): Polygons.
+        by (str): Field name, used to group polygons.(default=FID)
+
+    Returns:
+        tuple: ``(labels, keys, overlap)``. ``labels`` is an ``int32``
+        array with the shape of ``raster`` where ``0`` means outside of
+        every zone and ``i`` means the zone ``keys[i - 1]``. ``overlap`` is
+        the number of pixels covered by several zones, they get the
+        highest label.
+    """
+    # Group features by field values.
+    keys = []
+    labels = {}
+    geometries = []
+    layer.ResetReading()
+    for feature in layer:
+        key = feature[by] if by else feature.GetFID()
+        if key not in labels:
+            keys.append(key)
+            labels[key] = len(keys)
+        geometry = feature.GetGeometryRef()
+        if geometry is not None:
+            geometries.append((labels[key], geometry.Clone()))
+    layer.ResetReading()
+
+    geometries.sort(key=lambda item: item[0])
+    # The last burned zone wins, so these are the highest and the lowest
+    # label of every pixel.
+    highest = _burn(raster, layer.GetSpatialRef(), geometries)
+    lowest = _burn(raster, layer.GetSpatialRef(), geometries[::-1])
+    overlap = int(np.count_nonzero(highest != lowest))
+    return highest, keys, overlap
+
+
+def _burn(raster, srs, geometries):
+    """Burn ``(label, geometry)`` pairs in order into a label grid."""
+    mem_shp_driver = ogr.GetDriverByName("Memory")
+    tmp_shp = mem_shp_driver.CreateDataSource("")
+    tmp_layer = tmp_shp.CreateLayer("zones", srs, ogr.wkbUnknown)
+    tmp_layer.CreateField(ogr.FieldDefn("zone", ogr.OFTInteger))
+    defn = tmp_layer.GetLayerDefn()
+    for label, geometry in geometries:
+        tmp_feature = ogr.Feature(defn)
+        tmp_feature.SetGeometry(geometry)
+        tmp_feature.SetField("zone", label)
+        tmp_layer.CreateFeature(tmp_feature)
+
+    mem_raster_driver = gdal.GetDriverByName("MEM")
+    tmp_raster = mem_raster_driver.Create(
+        "", raster.shape[-1], raster.shape[-2], 1, gdal.GDT_Int32)
+    tmp_raster.SetProjection(raster.projection)
+    tmp_raster.SetGeoTransform(raster.transform)
+    tmp_raster.GetRasterBand(1).Fill(0)
+
+    gdal.RasterizeLayer(
+        tmp_raster, [1], tmp_layer, options=["ATTRIBUTE=zone"])
+
+    return tmp_raster.ReadAsArray().astype(np.int32, copy=False)
+
+
+class ZoneIndex(object):
+    """Pixels of a label grid grouped by zone.
+
+    Args:
+        labels (numpy.ndarray): Label grid, see :func:`rasterize_zones`.
+        keys (list): Zone keys, ``keys[i - 1]`` is the key of label ``i``.
+        overlap (int): Number of pixels covered by several zones.
+    """
+    def __init__(self, labels, keys, overlap=0):
+        self.labels = labels
+        self.keys = list(keys)
+        self.overlap = overlap
+        self.shape = labels.shape
+
+        flat = labels.ravel()
+        inside = np.flatnonzero(flat)
+        # Flat indices of every zoned pixel, sorted by label.
+        self.order = inside[np.argsort(flat[inside], kind="stable")]
+        counts = np.bincount(flat[inside], minlength=len(self.keys) + 1)
+        counts[0] = 0
+        self.bounds = np.concatenate([[0], np.cumsum(counts)])
+
+    @classmethod
+    def from_layer(cls, raster, layer, by=None):
+        """Rasterize ``layer`` on the grid of ``raster`` and index it."""
+        return cls(*rasterize_zones(raster, layer, by))
+
+    def pixels(self, label=None):
+        """Flat pixel indices of zone ``label``.
+
+        Args:
+            label (int): Zone label. ``None`` means the union of all zones.
+        """
+        if label is None:
+            return self.order
+        return self.order[self.bounds[label]:self.bounds[label + 1]]
+
+    def bbox(self, label=None):
+        """Bounding box ``(top, bottom, left, right)`` of zone ``label`` in
+        pixels, or ``None`` if the zone does not cover any pixel centre.
+        """
+        pixels = self.pixels(label)
+        if not len(pixels):
+            return None
+        rows, cols = np.divmod(pixels, self.shape[1])
+        return (int(rows.min()), int(rows.max()) + 1,
+                int(cols.min()), int(cols.max()) + 1)
+
+    def zone(self, raster, label=None):
+        """Get the part of ``raster`` covered by one zone.
+
+        The result is cropped to the bounding box of the zone and pixels
+        outside of the zone are masked. It is empty when the zone does not
+        cover any pixel centre.
+
+        Args:
+            raster (Raster): A raster on the indexed grid.
+            label (int): Zone label. ``None`` means the union of all zones.
+
+        Returns:
+            :class:`Raster`
+        """
+        bbox = self.bbox(label)
+        if bbox is None:
+            return _empty_zone(raster.dtype, raster.transform,
+                               raster.projection)
+
+        top, bottom, left, right = bbox
+        labels = self.labels[top:bottom, left:right]
+        mask = labels == 0 if label is None else labels != label
+        window = raster[top:bottom, left:right]
+        mask |= np.ma.getmaskarray(window)
+
+        return Raster(
+            np.ma.masked_array(window.data, mask),
+            _window_transform(raster.transform, top, left),
+            raster.projection)
+
+    def reduce(self, raster, stats, label=None):
+        """Calculate built-in reducers for every zone in one pass.
+
+        Args:
+            raster (Raster): A raster on the indexed grid.
+            stats (list of str): Reducer names, see :data:`STATS`.
+            label: ``None`` to reduce every zone, ``"overall"`` to reduce
+                the union of all zones.
+
+        Returns:
+            dict: Reducer name to an array with one value per zone. Zones
+            without valid pixels are masked (``count`` is ``0``).
+        """
+        data = np.ma.getdata(raster).ravel()
+        mask = np.ma.getmaskarray(raster).ravel()
+
+        pixels = self.order[~mask[self.order]]
+        if label == "overall":
+            labels = np.zeros(len(pixels), np.intp)
+            n = 1
+        else:
+            labels = self.labels.ravel()[pixels] - 1
+            n = len(self.keys)
+        return _group_reduce(data[pixels], labels, n, stats)
+
+
+def _indexes(raster, layer, by):
+    """Zone indexes of a list of rasters, one per grid.
+
+    Warns when zones overlap, see :func:`_clip_zones`.
+
+    Returns:
+        tuple: ``(indexes, overlap)``, ``indexes`` maps the grid keys to
+        :class:`ZoneIndex`, ``overlap`` is ``True`` when zones overlap on
+        one of the grids.
+    """
+    indexes = {}
+    for r in raster:
+        key = _grid_key(r)
+        if key not in indexes:
+            indexes[key] = ZoneIndex.from_layer(r, layer, by)
+    overlap = sum(index.overlap for index in indexes.values())
+    if overlap:
+        warnings.warn(
+            "Zones overlap on {} pixels, each zone is clipped by its own "
+            "polygons instead of one label grid.".format(overlap))
+    return indexes, bool(overlap)
+
+
+def _clip_zones(raster, layer, by, overall):
+    """Clip rasters by the polygons of every zone, one zone at a time.
+
+    Used instead of the label grid when zones overlap. Zones are cropped
+    to the envelope of their polygons.
+
+    Yields:
+        tuple: ``(key, rasters)``, one clipped raster per raster.
+    """
+    def clip(r, features):
+        try:
+            if features is None:
+                return r.clip_by_layer(layer, crop=True)
+            return r.clip_by_feature(features, crop=True)
+        except ValueError:
+            # The zone is outside of the raster.
+            return _empty_zone(r.dtype, r.transform, r.projection)
+
+    if overall:
+        overall = 'overall' if overall is True else overall
+        yield overall, [clip(r, None) for r in raster]
+
+    grouped_features = {}
+    layer.ResetReading()
+    for feature in layer:
+        key = feature[by] if by else feature.GetFID()
+        grouped_features.setdefault(key, []).append(feature)
+    layer.ResetReading()
+    for key, features in grouped_features.items():
+        yield key, [clip(r, features) for r in raster]
+
+
+def _empty_zone(dtype, transform, projection):
+    return Raster(np.empty((0, 0), dtype),
+                  _window_transform(transform, 0, 0), projection)
+
+
+def _zone_task(items, label, single, func, args, kwargs):
+    """Build zone views from shared memory and call ``func`` in a worker.
+
+    The blocks are detached again afterwards, a worker of a long-lived
+    pool does not keep them mapped after they are unlinked.
+    """
+    names = set()
+    for spec, _ in items:
+        names.add(spec["data"][0])
+        names.add(spec["labels"][0])
+        if spec["mask"] is not None:
+            names.add(spec["mask"][0])
+    try:
+        return func(_zone_views(items, label, single), *args, **kwargs)
+    finally:
+        detach(names)
+
+
+def _zone_views(items, label, single):
+    """Zone rasters of ``label`` viewing the shared memory blocks."""
+    rs = []
+    for spec, bbox in items:
+        if bbox is None:
+            rs.append(_empty_zone(
+                np.dtype(spec["data"][2]), spec["transform"],
+                spec["projection"]))
+            continue
+        top, bottom, left, right = bbox
+        labels = attach(spec["labels"])[top:bottom, left:right]
+        mask = labels == 0 if label is None else labels != label
+        if spec["mask"] is not None:
+            mask |= attach(spec["mask"])[top:bottom, left:right]
+        rs.append(Raster(
+            np.ma.masked_array(
+                attach(spec["data"])[top:bottom, left:right], mask),
+            _window_transform(spec["transform"], top, left),
+            spec["projection"]))
+    return rs[0] if single else rs
+
+
+def _collect(zones, workers, submit):
+    """Submit zones with at most ``2 * workers`` in flight.
+
+    When a zone fails, the zones not started yet are cancelled and the
+    running ones are waited for before the error is raised, so nothing
+    uses the inputs any more.
+
+    Returns:
+        dict: Zone key to result, in zone order.
+    """
+    futures = []
+    pending = set()
+    try:
+        for key, task in zones:
+            if len(pending) >= 2 * workers:
+                _, pending = wait(pending, return_when=FIRST_COMPLETED)
+            future = submit(task)
+            futures.append((key, future))
+            pending.add(future)
+        return {key: future.result() for key, future in futures}
+    except BaseException:
+        for _, future in futures:
+            future.cancel()
+        wait([future for _, future in futures])
+        raise
+
+
+def _executor(executor, workers):
+    """Get ``(executor, owned, is_process)``."""
+    if isinstance(executor, Executor):
+        return (executor, False,
+                isinstance(executor, ProcessPoolExecutor))
+    if executor == "thread":
+        return ThreadPoolExecutor(workers), True, False
+    if executor == "process":
+        return ProcessPoolExecutor(workers), True, True
+    raise ValueError(
+        "executor should be 'thread', 'process' or an Executor.")
+
+
+def parallel_zonal_apply(raster, shp_path, func, by=None, overall=False,
+                         args=(), kwargs={}, executor="thread",
+                         workers=None):
+    """Apply a function to each zone in a thread or process pool.
+
+    See :func:`gkit.core.functions.zonal_apply`. In a process pool the
+    rasters and the label grid are put into shared memory once, and the
+    workers build the zone views from it, so pixels are not pickled.
+    ``func`` and its results must be picklable.
+
+    Args:
+        executor (str or Executor): ``"thread"``, ``"process"`` or an
+            executor instance.
+        workers (int): Number of workers of a new pool.
+
+    Returns:
+        dict
+    """
+    workers = workers or os.cpu_count() or 1
+    executor, owned, is_process = _executor(executor, workers)
+    try:
+        if not is_process:
+            return _collect(
+                iter_zones(raster, shp_path, by, overall), workers,
+                lambda rs: executor.submit(func, rs, *args, **kwargs))
+        return _process_zonal_apply(
+            raster, shp_path, func, by, overall, args, kwargs,
+            executor, workers)
+    finally:
+        if owned:
+            executor.shutdown()
+
+
+def _process_zonal_apply(raster, shp_path, func, by, overall, args, kwargs,
+                         executor, workers):
+    single = isinstance(raster, Raster)
+    raster = [raster] if single else list(raster)
+    shp = ogr.Open(shp_path)
+    layer = shp.GetLayer()
+
+    blocks = []
+
+    def put(array):
+        block, spec = share(array)
+        blocks.append(block)
+        return spec
+
+    try:
+        indexes, overlap = _indexes(raster, layer, by)
+        if overlap:
+            return _collect(
+                _clip_zones(raster, layer, by, overall), workers,
+                lambda rs: executor.submit(
+                    func, rs[0] if single else rs, *args, **kwargs))
+
+        label_specs = {}
+        specs = []
+        for r in raster:
+            key = _grid_key(r)
+            if key not in label_specs:
+                label_specs[key] = put(indexes[key].labels)
+            mask = np.ma.getmask(r)
+            specs.append((indexes[key], {
+                "data": put(np.ma.getdata(r)),
+                "mask": None if mask is np.ma.nomask else put(mask),
+                "labels": label_specs[key],
+                "transform": r.transform,
+                "projection": r.projection,
+            }))
+        keys = indexes[_grid_key(raster[0])].keys
+
+        labels = list(enumerate(keys, 1))
+        if overall:
+            labels.insert(
+                0, (None, 'overall' if overall is True else overall))
+
+        def zones():
+            for label, key in labels:
+                items = [(spec, index.bbox(label)) for index, spec in specs]
+                yield key, (items, label)
+
+        return _collect(
+            zones(), workers,
+            lambda task: executor.submit(
+                _zone_task, task[0], task[1], single, func, args, kwargs))
+    finally:
+        release(blocks)
+
+
+def _group_reduce(values, labels, n, stats):
+    """Reduce ``values`` grouped by sorted ``labels`` in ``[0, n)``."""
+    count = np.bincount(labels, minlength=n)
+    empty = count == 0
+    starts = np.concatenate([[0], np.cumsum(count)[:-1]])
+    filled = starts[~empty]
+
+    result = {}
+    cache = {}
+
+    def total():
+        if "sum" not in cache:
+            cache["sum"] = np.bincount(
+                labels, weights=values, minlength=n)
+        return cache["sum"]
+
+    def mean():
+        if "mean" not in cache:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                cache["mean"] = total() / count
+        return cache["mean"]
+
+    def ordered():
+        if "ordered" not in cache:
+            # Labels are sorted already, sort values inside each zone.
+            cache["ordered"] = values[np.lexsort((values, labels))]
+        return cache["ordered"]
+
+    def percentile(q):
+        ordered_values = ordered()
+        res = np.zeros(n, np.float64)
+        position = q / 100. * (count[~empty] - 1)
+        lower = np.floor(position).astype(np.intp)
+        upper = np.minimum(lower + 1, count[~empty] - 1)
+        fraction = position - lower
+        res[~empty] = ordered_values[filled + lower] * (1 - fraction) + \
+            ordered_values[filled + upper] * fraction
+        return res
+
+    for stat in stats:
+        _check_stat(stat)
+        if stat == "count":
+            result[stat] = count
+            continue
+
+        if stat == "sum":
+            res = total()
+        elif stat == "mean":
+            res = mean()
+        elif stat == "std":
+            deviation = values - mean()[labels]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                res = np.sqrt(np.bincount(
+                    labels, weights=deviation * deviation, minlength=n
+                ) / count)
+        elif stat in ("min", "max"):
+            res = np.zeros(n, values.dtype)
+            if len(filled):
+                ufunc = np.minimum if stat == "min" else np.maximum
+                res[~empty] = ufunc.reduceat(values, filled)
+        elif stat == "median":
+            res = percentile(50)
+        else:
+            res = percentile(float(_PERCENTILE.match(stat).group(1)))
+        result[stat] = np.ma.masked_array(res, empty)
+
+    return result
+
+
+def iter_zones(raster, shp_path, by=None, overall=False):
+    """Split rasters by polygons from shapefile, one zone at a time.
+
+    All zones are rasterized once. Each zone is cropped to its bounding
+    box with pixels outside of the zone masked (see :meth:`ZoneIndex.zone`)
+    and yielded right away.
+
+    Args:
+        raster (Raster or list of Raster): One or more rasters.
+        shp_path (str): Shapefile path.
+        by (str): Field name, used to group polygons.(default=FID)
+        overall (bool): Use whole area(combine all polygons) as a result.
+            (default=False)
+
+    Yields:
+        tuple: ``(key, raster)``, ``raster`` is a list when there are
+        several input rasters.
+    """
+    single = isinstance(raster, Raster)
+    raster = [raster] if single else list(raster)
+    shp = ogr.Open(shp_path)
+    layer = shp.GetLayer()
+
+    indexes, overlap = _indexes(raster, layer, by)
+    if overlap:
+        for key, rs in _clip_zones(raster, layer, by, overall):
+            yield key, rs[0] if single else rs
+        return
+    index = indexes[_grid_key(raster[0])]
+
+    def zone(label):
+        rs = [indexes[_grid_key(r)].zone(r, label) for r in raster]
+        return rs[0] if single else rs
+
+    if overall:
+        overall = 'overall' if overall is True else overall
+        yield overall, zone(None)
+    for label, key in enumerate(index.keys, 1):
+        yield key, zone(label)
+
+
+def zonal_stats(raster, shp_path, stats=("count", "mean", "min", "max"),
+                by=None, overall=False):
+    """Calculate built-in statistics of each zone.
+
+    All zones are rasterized once and reduced together, so it is much
+    faster than :func:`zonal_apply` with a Python function.
+
+    Args:
+        raster (Raster or list of Raster): One or more rasters.
+        shp_path (str): Shapefile path.
+        stats (str or list of str):
+            |  Could be following options:
+            |  ``count``, ``sum``, ``mean``, ``min``, ``max``, ``std``,
+                ``median``
+            |  ``percentile_<q>``, e.g. ``percentile_90``
+        by (str): Field name, used to group polygons.(default=FID)
+        overall (bool): Use whole area(combine all polygons) as a result.
+            (default=False)
+
+    Returns:
+        dict: ``{zone: {stat: value}}``. When ``stats`` is a str,
+        ``{zone: value}``. Each value becomes a list with one item per
+        raster when ``raster`` is a list.
+    """
+    single_stat = isinstance(stats, str)
+    stats = [stats] if single_stat else list(stats)
+    for stat in stats:
+        _check_stat(stat)
+
+    single_raster = isinstance(raster, Raster)
+    raster = [raster] if single_raster else list(raster)
+
+    shp = ogr.Open(shp_path)
+    layer = shp.GetLayer()
+
+    def pack(values):
+        if single_stat:
+            values = [v[stats[0]] for v in values]
+        return values[0] if single_raster else values
+
+    indexes, overlap = _indexes(raster, layer, by)
+    if overlap:
+        result = {}
+        for key, rs in _clip_zones(raster, layer, by, overall):
+            values = []
+            for r in rs:
+                data = r.compressed()
+                res = _group_reduce(
+                    data, np.zeros(len(data), np.intp), 1, stats)
+                values.append({stat: res[stat][0] for stat in stats})
+            result[key] = pack(values)
+        return result
+
+    reduced = []
+    for r in raster:
+        index = indexes[_grid_key(r)]
+        reduced.append((
+            index.reduce(r, stats, "overall") if overall else None,
+            index.reduce(r, stats),
+        ))
+    keys = index.keys
+
+    def collect(i, which):
+        return pack([
+            {stat: res[which][stat][i] for stat in stats}
+            for res in reduced
+        ])
+
+    result = {}
+    if overall:
+        overall = 'overall' if overall is True else overall
+        result[overall] = collect(0, 0)
+    for i, key in enumerate(keys):
+        result[key] = collect(i, 1)
+    return result
@@ -0,0 +1,181 @@
+"""Discovery of raster files for the command line tools.
+
+``re://<regex>`` arguments are expanded into the files below the current
+directory whose relative path matches the regex. All patterns are matched
+during one ``os.scandir`` walk, directories which can not match a
+``^``-anchored pattern are skipped, and only files with extensions of GDAL
+raster drivers are kept, unless ``extensions=()`` is given. The file list
+could be saved into an index file and read back by later runs instead of
+walking again.
+"""
+import os
+import re
+from functools import lru_cache
+
+from osgeo import gdal
+
+
+PREFIX = "re://"
+
+_SPECIAL = set(".^$*+?{}[]\\|()")
+
+
+@lru_cache(maxsize=1)
+def raster_extensions():
+    """Lower case file extensions of the GDAL raster drivers."""
+    extensions = set()
+    for i in range(gdal.GetDriverCount()):
+        driver = gdal.GetDriver(i)
+        if driver.GetMetadataItem("DCAP_RASTER") != "YES":
+            continue
+        for key in ("DMD_EXTENSIONS", "DMD_EXTENSION"):
+            value = driver.GetMetadataItem(key)
+            if value:
+                extensions.update(e.lower().lstrip(".")
+                                  for e in value.split())
+    return frozenset(extensions)
+
+
+def literal_prefix(pattern):
+    """Literal text every match of a ``^``-anchored ``pattern`` starts
+    with, e.g. ``data/2020`` of ``^data/2020/.*\\.tif$``.
+
+    Returns:
+        str: Empty when the pattern is not anchored or has alternatives.
+    """
+    if not pattern.startswith("^") or "|" in pattern:
+        return ""
+    prefix = []
+    i = 1
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\":
+            if i + 1 >= len(pattern) or pattern[i + 1].isalnum():
+                # A class like \d, or an escape sequence.
+                break
+            char = pattern[i + 1]
+            i += 2
+        elif char in _SPECIAL:
+            break
+        else:
+            i += 1
+        if i < len(pattern) and pattern[i] in "?*{":
+            # The last character is optional.
+            break
+        prefix.append(char)
+    return "".join(prefix)
+
+
+def _could_contain(directory, prefixes):
+    """If files below ``directory`` could start with one of ``prefixes``.
+    """
+    directory += os.sep
+    return any(p.startswith(directory) or directory.startswith(p)
+               for p in prefixes)
+
+
+def walk(root=".", prefixes=None):
+    """Yield relative paths of the files below ``root``.
+
+    Entries are sorted by name in each directory. Symbolic links to
+    directories are not followed.
+
+    Args:
+        prefixes (list of str): Skip directories which can not contain
+            paths starting with one of them. ``None`` walks everything.
+    """
+    stack = [""]
+    while stack:
+        parent = stack.pop()
+        try:
+            with os.scandir(os.path.join(root, parent) if parent
+                            else root) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+
+        directories = []
+        for entry in entries:
+            path = os.path.join(parent, entry.name) if parent else entry.name
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if is_dir:
+                if prefixes is None or _could_contain(path, prefixes):
+                    directories.append(path)
+            else:
+                yield path
+        # Visit directories in order.
+        stack.extend(reversed(directories))
+
+
+def read_index(index):
+    """Read a file list written by :func:`write_index`."""
+    with open(index, encoding="utf-8") as f:
+        return [line.rstrip("\n") for line in f if line.strip()]
+
+
+def write_index(index, files):
+    """Write a file list, one relative path per line."""
+    tmp = index + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for fn in files:
+            f.write(fn + "\n")
+    os.replace(tmp, index)
+
+
+def find(patterns, extensions=None, index=None, root="."):
+    """Find the files matching regex patterns.
+
+    Args:
+        patterns (list of str): Regexes searched in the relative paths.
+        extensions (set of str): Only keep files with these extensions.
+            Use the extensions of GDAL raster drivers if it is ``None``,
+            keep all files if it is empty, e.g. ``extensions=()``.
+        index (str): File list of ``root``. Read from it if it exists
+            instead of walking the tree, otherwise write all files of the
+            tree into it. Delete it to rescan.
+        root (str): Root directory.
+
+    Returns:
+        dict: Pattern to the list of matched files.
+    """
+    patterns = list(dict.fromkeys(patterns))
+    compiled = [re.compile(p) for p in patterns]
+    if extensions is None:
+        extensions = raster_extensions()
+    extensions = set(e.lower().lstrip(".") for e in extensions)
+
+    if index is not None and os.path.exists(index):
+        files = read_index(index)
+    elif index is not None:
+        files = list(walk(root))
+        write_index(index, files)
+    else:
+        prefixes = [literal_prefix(p) for p in patterns]
+        files = walk(root, None if "" in prefixes else prefixes)
+
+    matched = {p: [] for p in patterns}
+    for fn in files:
+        if extensions and \
+                os.path.splitext(fn)[1][1:].lower() not in extensions:
+            continue
+        for pattern, regex in zip(patterns, compiled):
+            if regex.search(fn) is not None:
+                matched[pattern].append(fn)
+    return matched
+
+
+def discover(*args, extensions=None, index=None):
+    """Expand ``re://`` patterns into file paths, other arguments are
+    yielded as they are. See :func:`find`.
+    """
+    patterns = [fn[len(PREFIX):] for fn in args if fn.startswith(PREFIX)]
+    matched = find(patterns, extensions, index) if patterns else {}
+    for fn in args:
+        if fn.startswith(PREFIX):
+            for path in matched[fn[len(PREFIX):]]:
+                yield path
+        else:
+            yield fn
@@ -0,0 +1,349 @@
+"""Safe raster expressions, used by the command line tools.
+
+A formula like ``(r - 273.15) * 1.8 + 32`` is parsed once into a tree of
+numpy operations. Only arithmetic, comparisons, indexing lists of rasters
+by a number and the functions of :mod:`gkit.math` are allowed, anything
+else (attributes, keywords, other names of functions...) is rejected before
+evaluation.
+
+The tree is evaluated by chunks of rows. Each operation writes into its
+own scratch buffer, which is reused by the next chunks, and carries the
+mask next to the data instead of building masked temporaries. Invalid
+results (division by zero, log of negative numbers...) are masked as
+:mod:`numpy.ma` does.
+"""
+import ast
+
+import numpy as np
+
+from .core import Raster
+
+
+#: Pixels of a chunk.
+CHUNK_PIXELS = 2 ** 20
+
+_BINARY = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.true_divide,
+    ast.FloorDiv: np.floor_divide,
+    ast.Mod: np.remainder,
+    ast.Pow: np.power,
+    ast.BitAnd: np.bitwise_and,
+    ast.BitOr: np.bitwise_or,
+    ast.BitXor: np.bitwise_xor,
+}
+
+_COMPARE = {
+    ast.Eq: np.equal,
+    ast.NotEq: np.not_equal,
+    ast.Lt: np.less,
+    ast.LtE: np.less_equal,
+    ast.Gt: np.greater,
+    ast.GtE: np.greater_equal,
+}
+
+_UNARY = {
+    ast.USub: np.negative,
+    ast.UAdd: np.positive,
+    ast.Invert: np.invert,
+}
+
+#: Element-wise functions of :mod:`gkit.math`.
+FUNCTIONS = {
+    "sin": np.sin,
+    "sinh": np.sinh,
+    "cos": np.cos,
+    "cosh": np.cosh,
+    "tan": np.tan,
+    "tanh": np.tanh,
+    "radians": np.radians,
+    "log": np.log,
+    "log2": np.log2,
+    "log10": np.log10,
+    "exp": np.exp,
+    "abs": np.absolute,
+}
+
+#: Per-pixel aggregations of a list of rasters, see :mod:`gkit.math`.
+AGGREGATIONS = {
+    "max": np.ma.max,
+    "min": np.ma.min,
+    "median": np.ma.median,
+    "count": np.ma.count,
+    "mean": np.ma.mean,
+    "sum": np.ma.sum,
+    "std": np.ma.std,
+}
+
+# Integer results of these are masked where the divisor is zero.
+_DIVISIONS = (np.true_divide, np.floor_divide, np.remainder)
+
+
+def _buffer(scratch, key, shape, dtype):
+    """Get a reusable buffer, the first rows of it for a shorter chunk."""
+    buf = scratch.get(key)
+    if buf is None or buf.shape[1:] != shape[1:] or len(buf) < shape[0]:
+        buf = scratch[key] = np.empty(shape, dtype)
+    return buf[:shape[0]]
+
+
+def _apply(ufunc, operands, scratch, key):
+    """Apply ``ufunc`` to ``(data, mask)`` operands.
+
+    Returns:
+        tuple: ``(data, mask)``, ``mask`` is ``None`` when nothing is
+        masked.
+    """
+    datas = [d for d, _ in operands]
+    shape = np.broadcast_shapes(*[np.shape(d) for d in datas])
+    with np.errstate(all="ignore"):
+        if not shape:
+            data = ufunc(*datas)
+        else:
+            buf = scratch.get(key)
+            if buf is None:
+                # Find the result type on one element.
+                dtype = ufunc(*[
+                    d.ravel()[:1] if np.ndim(d) else d for d in datas]).dtype
+            else:
+                dtype = buf.dtype
+            data = ufunc(*datas, out=_buffer(scratch, key, shape, dtype))
+
+    masks = [m for _, m in operands if m is not None]
+    if shape and data.dtype.kind in "fc":
+        invalid = _buffer(scratch, (key, "invalid"), shape, bool)
+        np.isfinite(data, out=invalid)
+        np.logical_not(invalid, out=invalid)
+        masks.append(invalid)
+    elif shape and ufunc in _DIVISIONS:
+        invalid = _buffer(scratch, (key, "invalid"), shape, bool)
+        np.equal(datas[1], 0, out=invalid)
+        masks.append(invalid)
+
+    if not masks:
+        return data, None
+    if len(masks) == 1 and np.shape(masks[0]) == shape:
+        return data, masks[0]
+    mask = _buffer(scratch, (key, "mask"), shape, bool)
+    mask[...] = masks[0]
+    for m in masks[1:]:
+        np.logical_or(mask, m, out=mask)
+    return data, mask
+
+
+def _pair(value):
+    if isinstance(value, list):
+        raise ValueError(
+            "Expected a raster, got a list. Select one with r[i].")
+    return value
+
+
+class Expression(object):
+    """A parsed raster formula.
+
+    Args:
+        formula (str): E.g. ``"(r - 273.15) * 1.8 + 32"`` or
+            ``"mean(r) - r[0]"`` when ``r`` is a list of rasters.
+
+    Raises:
+        ValueError: The formula is not valid or not allowed.
+
+    Example:
+        >>> Expression("(b2 - b1) / (b2 + b1)")(b1=red, b2=nir)
+    """
+    def __init__(self, formula):
+        self.formula = formula
+        self.names = set()
+        try:
+            tree = ast.parse(formula.strip(), mode="eval")
+        except SyntaxError as e:
+            raise ValueError("Invalid formula {!r}: {}".format(formula, e))
+        self._keys = 0
+        self._root = self._compile(tree.body)
+
+    def _error(self, node):
+        return ValueError("{} is not allowed in formula {!r}.".format(
+            type(node).__name__, self.formula))
+
+    def _compile(self, node):
+        self._keys += 1
+        key = self._keys
+
+        if isinstance(node, ast.Constant):
+            if isinstance(node.value, bool) or \
+                    not isinstance(node.value, (int, float)):
+                raise self._error(node)
+            value = node.value
+            return lambda env, rows, scratch: (value, None)
+
+        if isinstance(node, ast.Name):
+            if node.id in FUNCTIONS or node.id in AGGREGATIONS:
+                raise self._error(node)
+            self.names.add(node.id)
+            name = node.id
+
+            def variable(env, rows, scratch):
+                value = env[name]
+                if isinstance(value, list):
+                    return [(d[rows], m if m is None else m[rows])
+                            for d, m in value]
+                data, mask = value
+                if not np.ndim(data):
+                    return value
+                return data[rows], mask if mask is None else mask[rows]
+            return variable
+
+        if isinstance(node, ast.List):
+            items = [self._compile(e) for e in node.elts]
+            return lambda env, rows, scratch: [
+                _pair(f(env, rows, scratch)) for f in items]
+
+        if isinstance(node, ast.Subscript):
+            index = node.slice
+            if isinstance(index, getattr(ast, "Index", ())):
+                index = index.value  # Python < 3.9
+            try:
+                index = ast.literal_eval(index)
+            except ValueError:
+                raise self._error(node)
+            if not isinstance(index, int) or isinstance(index, bool):
+                raise self._error(node)
+            value = self._compile(node.value)
+
+            def item(env, rows, scratch):
+                items = value(env, rows, scratch)
+                if not isinstance(items, list):
+                    raise ValueError("Only lists of rasters are indexable.")
+                return items[index]
+            return item
+
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+            ufunc = _BINARY[type(node.op)]
+            left = self._compile(node.left)
+            right = self._compile(node.right)
+            return lambda env, rows, scratch: _apply(
+                ufunc, [_pair(left(env, rows, scratch)),
+                        _pair(right(env, rows, scratch))], scratch, key)
+
+        if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY:
+            ufunc = _UNARY[type(node.op)]
+            operand = self._compile(node.operand)
+            return lambda env, rows, scratch: _apply(
+                ufunc, [_pair(operand(env, rows, scratch))], scratch, key)
+
+        if isinstance(node, ast.Compare) and len(node.ops) == 1 and \
+                type(node.ops[0]) in _COMPARE:
+            ufunc = _COMPARE[type(node.ops[0])]
+            left = self._compile(node.left)
+            right = self._compile(node.comparators[0])
+            return lambda env, rows, scratch: _apply(
+                ufunc, [_pair(left(env, rows, scratch)),
+                        _pair(right(env, rows, scratch))], scratch, key)
+
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) \
+                and not node.keywords:
+            name = node.func.id
+            args = [self._compile(a) for a in node.args]
+            if name in FUNCTIONS and len(args) == 1:
+                ufunc = FUNCTIONS[name]
+                return lambda env, rows, scratch: _apply(
+                    ufunc, [_pair(args[0](env, rows, scratch))],
+                    scratch, key)
+            if name in AGGREGATIONS and len(args) == 1:
+                return self._aggregation(AGGREGATIONS[name], args[0])
+            raise ValueError("Function {!r} is not allowed in formula "
+                             "{!r}.".format(name, self.formula))
+
+        raise self._error(node)
+
+    @staticmethod
+    def _aggregation(func, arg):
+        def aggregation(env, rows, scratch):
+            items = arg(env, rows, scratch)
+            if not isinstance(items, list):
+                raise ValueError("Aggregations need a list of rasters.")
+            arrays = [np.ma.masked_array(d, False if m is None else m)
+                      for d, m in items]
+            res = func(arrays, axis=0)
+            mask = np.ma.getmask(res)
+            return np.ma.getdata(res), \
+                None if mask is np.ma.nomask else mask
+        return aggregation
+
+    def __call__(self, rasters=None, rows=None, **kwargs):
+        """Evaluate the formula.
+
+        Args:
+            rasters (dict): Values of the names, a :class:`Raster`, a list
+                of :class:`Raster` or a number. Could be given as keyword
+                arguments too.
+            rows (int): Rows of a chunk. (default: about
+                :data:`CHUNK_PIXELS` pixels)
+
+        Returns:
+            :class:`Raster`
+        """
+        values = dict(rasters or {}, **kwargs)
+        missing = self.names - set(values)
+        if missing:
+            raise ValueError("Formula {!r} needs {}.".format(
+                self.formula, sorted(missing)))
+
+        env = {}
+        grid = []
+        for name in self.names:
+            value = values[name]
+            if isinstance(value, Raster):
+                grid.append(value)
+            elif isinstance(value, (list, tuple)):
+                value = list(value)
+                grid.extend(value)
+            elif not np.isscalar(value):
+                raise ValueError("{} should be a raster, a list of rasters "
+                                 "or a number.".format(name))
+            env[name] = self._prepare(value)
+
+        if not grid:
+            raise ValueError(
+                "Formula {!r} uses no raster.".format(self.formula))
+        shapes = set(r.shape for r in grid)
+        if len(shapes) != 1 or grid[0].ndim != 2:
+            raise ValueError(
+                "Rasters should have the same 2-D shape, got {}.".format(
+                    sorted(shapes)))
+        shape = grid[0].shape
+        rows = rows or max(CHUNK_PIXELS // max(shape[1], 1), 1)
+
+        scratch = {}
+        out = None
+        mask = np.zeros(shape, bool)
+        for y in range(0, shape[0], rows):
+            data, m = _pair(self._root(env, slice(y, y + rows), scratch))
+            if out is None:
+                out = np.empty(shape, np.asarray(data).dtype)
+            out[y:y + rows] = data
+            if m is not None:
+                mask[y:y + rows] = m
+
+        return Raster(np.ma.masked_array(out, mask), grid[0].transform,
+                      grid[0].projection)
+
+    @staticmethod
+    def _prepare(value):
+        if isinstance(value, list):
+            return [Expression._prepare(r) for r in value]
+        if isinstance(value, Raster):
+            mask = np.ma.getmask(value)
+            return (np.ma.getdata(value),
+                    None if mask is np.ma.nomask else mask)
+        return value, None
+
+    def __repr__(self):
+        return "Expression<{!r}>".format(self.formula)
+
+
+def evaluate(formula, rasters=None, **kwargs):
+    """Parse and evaluate a formula. See :class:`Expression`."""
+    return Expression(formula)(rasters, **kwargs)
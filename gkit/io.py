@@ -2,11 +2,193 @@
 """
 import os
 import numpy as np
-from osgeo import gdal
-from .core import Raster
+from osgeo import gdal, gdal_array, ogr
+from .core import Raster, RasterStack
+from .discover import discover
+from .core.raster import _window_transform, _world_to_pixel, _points, \
+    _sample, _extent_to_window
 
 
-def read_gdal(ds, band=None, **kwargs):
+def _check_window(window, xsize, ysize):
+    xoff, yoff, win_xsize, win_ysize = map(int, window)
+    if xoff < 0 or yoff < 0 or win_xsize <= 0 or win_ysize <= 0 or \
+            xoff + win_xsize > xsize or yoff + win_ysize > ysize:
+        raise ValueError(
+            "Window {} is outside of the raster ({}, {}).".format(
+                window, xsize, ysize))
+    return xoff, yoff, win_xsize, win_ysize
+
+
+def _stack_nodata(ds, bands):
+    """Nodata value shared by ``bands``, or a list of per-band values."""
+    nodata = [ds.GetRasterBand(b).GetNoDataValue() for b in bands]
+    if len(set(nodata)) == 1:
+        return nodata[0]
+    return [np.nan if v is None else v for v in nodata]
+
+
+# Resampling names of decimated reads and overviews.
+RESAMPLING = {
+    "nearest": "NearestNeighbour",
+    "bilinear": "Bilinear",
+    "cubic": "Cubic",
+    "cubicspline": "CubicSpline",
+    "lanczos": "Lanczos",
+    "average": "Average",
+    "mode": "Mode",
+    "gauss": "Gauss",
+}
+
+
+def _resample_alg(resampling):
+    try:
+        return getattr(gdal, "GRIORA_" + RESAMPLING[resampling.lower()])
+    except KeyError:
+        raise ValueError("Unknown resampling method {!r}, should be one "
+                         "of {}.".format(resampling, list(RESAMPLING)))
+
+
+def _buffer_size(ds, window, overview=None, resolution=None):
+    """Size ``(xsize, ysize)`` of a decimated read of ``window``.
+
+    Returns:
+        tuple or ``None`` for a full resolution read.
+    """
+    if overview is None and resolution is None:
+        return None
+
+    if overview is not None:
+        band = ds.GetRasterBand(1)
+        count = band.GetOverviewCount()
+        if -count <= overview < count:
+            ov = band.GetOverview(overview % count)
+            fx = ov.XSize / ds.RasterXSize
+            fy = ov.YSize / ds.RasterYSize
+        elif overview >= 0:
+            # No such overview, decimate as it would have been built.
+            fx = fy = 0.5 ** (overview + 1)
+        else:
+            raise ValueError("The raster has only {} overviews.".format(
+                count))
+    else:
+        xres, yres = resolution if np.iterable(resolution) else \
+            (resolution, resolution)
+        transform = ds.GetGeoTransform()
+        fx = abs(transform[1]) / abs(xres)
+        fy = abs(transform[5]) / abs(yres)
+
+    return (max(int(round(window[2] * fx)), 1),
+            max(int(round(window[3] * fy)), 1))
+
+
+def _scale_transform(transform, fx, fy):
+    """Transform of the same area with pixels ``fx`` by ``fy`` times as
+    large.
+    """
+    return (transform[0], transform[1] * fx, transform[2] * fy,
+            transform[3], transform[4] * fx, transform[5] * fy)
+
+
+def _envi_header(ds):
+    """Parse ``key = value`` items of the ENVI header of ``ds``."""
+    header = {}
+    for fn in ds.GetFileList():
+        if fn.lower().endswith(".hdr"):
+            with open(fn) as f:
+                for line in f:
+                    if "=" in line:
+                        key, value = line.split("=", 1)
+                        header[key.strip().lower()] = value.strip().lower()
+    return header
+
+
+def _tiff_byte_order(path):
+    with open(path, "rb") as f:
+        return "<" if f.read(2) == b"II" else ">"
+
+
+def _memmap_band(ds, band):
+    """Map the pixels of an uncompressed band into memory.
+
+    Supports striped uncompressed GeoTIFF (band interleaved, contiguous
+    strips) and ENVI files.
+
+    Returns:
+        :class:`numpy.memmap` (copy-on-write) or ``None`` when the layout
+        of the file does not allow it.
+    """
+    files = ds.GetFileList()
+    if not files:
+        return None
+    path = files[0]
+    driver = ds.GetDriver().ShortName
+    b = ds.GetRasterBand(band)
+    dtype = np.dtype(gdal_array.GDALTypeCodeToNumericTypeCode(b.DataType))
+    shape = ds.RasterYSize, ds.RasterXSize
+
+    if driver == "GTiff":
+        compression = ds.GetMetadataItem("COMPRESSION", "IMAGE_STRUCTURE")
+        interleave = ds.GetMetadataItem("INTERLEAVE", "IMAGE_STRUCTURE")
+        if compression not in (None, "NONE") or \
+                b.GetMetadataItem("NBITS", "IMAGE_STRUCTURE") or \
+                (ds.RasterCount > 1 and interleave != "BAND"):
+            return None
+        block_xsize, block_ysize = b.GetBlockSize()
+        if block_xsize != ds.RasterXSize:
+            # Tiles can not be viewed as a 2-D array.
+            return None
+
+        strip_bytes = block_ysize * block_xsize * dtype.itemsize
+        strips = -(-ds.RasterYSize // block_ysize)
+        offsets = [
+            b.GetMetadataItem("BLOCK_OFFSET_0_{}".format(i), "TIFF")
+            for i in range(strips)
+        ]
+        if None in offsets:
+            return None
+        offsets = np.array(offsets, np.int64)
+        if (np.diff(offsets) != strip_bytes).any():
+            return None
+        offset = int(offsets[0])
+        dtype = dtype.newbyteorder(_tiff_byte_order(path))
+    elif driver == "ENVI":
+        header = _envi_header(ds)
+        offset = int(header.get("header offset", 0))
+        if header.get("byte order", "0") == "1":
+            dtype = dtype.newbyteorder(">")
+        else:
+            dtype = dtype.newbyteorder("<")
+        interleave = header.get("interleave", "bsq")
+        bands = ds.RasterCount
+        if interleave == "bsq":
+            offset += (band - 1) * shape[0] * shape[1] * dtype.itemsize
+        elif interleave == "bil":
+            try:
+                array = np.memmap(path, dtype, "c", offset,
+                                  (shape[0], bands, shape[1]))
+            except (ValueError, OSError):
+                return None
+            return array[:, band - 1, :]
+        elif interleave == "bip":
+            try:
+                array = np.memmap(path, dtype, "c", offset, shape + (bands,))
+            except (ValueError, OSError):
+                return None
+            return array[..., band - 1]
+        else:
+            return None
+    else:
+        return None
+
+    try:
+        return np.memmap(path, dtype, "c", offset, shape)
+    except (ValueError, OSError):
+        return None
+
+
+def read_gdal(ds, band=None, window=None, extent=None, stack=False,
+              mmap=False, overview=None, resolution=None,
+              resampling="nearest", **kwargs):
     """Read raster from :class:`gdal.Dataset`.
 
     Args:
@@ -15,15 +197,46 @@ def read_gdal(ds, band=None, **kwargs):
             |  Band number (read all bands by default)
             |  Should be a int or list to read one or more bands.
             |  Bands are numbered starting from 1.
+        window (tuple): Only read the pixel window
+            ``(xoff, yoff, xsize, ysize)``.
+        extent: Only read pixels covering the extent. Could be
+            ``[left, right, bottom, top]``, an :class:`ogr.Geometry`, an
+            :class:`ogr.Feature`, an :class:`ogr.Layer` or a vector file
+            path (use the bounding box of them, transformed into the
+            projection of the raster). Ignored if ``window`` is given.
+        stack (bool): Read all bands with one call into a
+            :class:`RasterStack`.
+        mmap (bool): Map the pixels of uncompressed, simply laid out files
+            (striped GeoTIFF, ENVI) into memory instead of reading them, so
+            processes share the page cache. Other files are read normally.
+            The mapping is copy-on-write, changes are not saved into file.
+            Can not be used with ``stack=True``.
+        overview (int): Read at the resolution of an overview,
+            ``overview=0`` is the first (usually half resolution) one.
+            Existing overviews are read directly, otherwise the pixels are
+            decimated as if the overview existed.
+        resolution (float or tuple): Read at this pixel size (or
+            ``(xres, yres)``), in units of the projection. Overviews are
+            used when they fit. Ignored if ``overview`` is given.
+        resampling (str): Resampling method of decimated reads, could be
+            ``nearest`` (default), ``bilinear``, ``cubic``, ``cubicspline``,
+            ``lanczos``, ``average``, ``mode`` or ``gauss``.
 
     Returns:
-        :class:`Raster` or a list of :class:`Raster`.
+        :class:`Raster` or a list of :class:`Raster`, or
+        :class:`RasterStack` if ``stack=True``.
+
+    Raises:
+        ValueError: Both ``stack`` and ``mmap`` are given.
     """
+    if stack and mmap:
+        raise ValueError("mmap can not be used with stack=True, the bands "
+                         "are copied into one array.")
     kwargs.setdefault("projection", ds.GetProjection())
     kwargs.setdefault("transform", ds.GetGeoTransform())
 
     if band is None:
-        band = np.arange(1, ds.RasterCount + 1) or \
+        band = np.arange(1, ds.RasterCount + 1) if ds.RasterCount else \
             np.arange(1, len(ds.GetSubDatasets()) + 1)
     elif isinstance(band, int):
         band = np.array([band])
@@ -34,10 +247,45 @@ def read_gdal(ds, band=None, **kwargs):
         "{} contains invalid bands number.".format(band)
 
     if ds.RasterCount:
+        if window is None and extent is not None:
+            window = _extent_to_window(
+                kwargs["transform"], ds.RasterXSize, ds.RasterYSize, extent,
+                kwargs["projection"])
+        if window is not None:
+            window = _check_window(window, ds.RasterXSize, ds.RasterYSize)
+            kwargs["transform"] = _window_transform(
+                kwargs["transform"], window[1], window[0])
+
+        full = window or (0, 0, ds.RasterXSize, ds.RasterYSize)
+        buf = _buffer_size(ds, full, overview, resolution)
+        read_kwargs = {}
+        if buf is not None:
+            kwargs["transform"] = _scale_transform(
+                kwargs["transform"], full[2] / buf[0], full[3] / buf[1])
+            read_kwargs = {"buf_xsize": buf[0], "buf_ysize": buf[1],
+                           "resample_alg": _resample_alg(resampling)}
+            mmap = False
+
+        if stack:
+            band_list = [int(b) for b in band]
+            array = ds.ReadAsArray(*full, band_list=band_list, **read_kwargs)
+            if array.ndim == 2:
+                array = array[np.newaxis]
+            kwargs.setdefault("nodatavalue", _stack_nodata(ds, band_list))
+            return RasterStack(array, **kwargs)
+
         data = []
         for b in band:
+            array = _memmap_band(ds, int(b)) if mmap else None
             b = ds.GetRasterBand(int(b))
-            array = b.ReadAsArray()
+            if array is not None:
+                if window:
+                    xoff, yoff, xsize, ysize = window
+                    array = array[yoff:yoff + ysize, xoff:xoff + xsize]
+            elif window or read_kwargs:
+                array = b.ReadAsArray(*full, **read_kwargs)
+            else:
+                array = b.ReadAsArray()
             kwargs.setdefault("nodatavalue", b.GetNoDataValue())
             r = Raster(array, **kwargs)
             data.append(r)
@@ -46,9 +294,13 @@ def read_gdal(ds, band=None, **kwargs):
         if not len(band):
             band = np.arange(1, len(subset) + 1)
         data = [
-            read_gdal(gdal.Open(subset[b-1][0]), 1, **kwargs)
+            read_gdal(gdal.Open(subset[b-1][0]), 1, window, extent,
+                      mmap=mmap, overview=overview, resolution=resolution,
+                      resampling=resampling, **kwargs)
             for b in band
         ]
+        if stack:
+            return RasterStack.from_rasters(data)
 
     if len(data) == 1:
         return data[0]
@@ -56,56 +308,416 @@ def read_gdal(ds, band=None, **kwargs):
         return data
 
 
-def read(filepath, band=None, **kwargs):
+def _slice_to_range(key, size):
+    """Convert an index along one axis into ``(offset, count, step)``."""
+    if isinstance(key, slice):
+        start, stop, step = key.indices(size)
+        if step < 0:
+            return None
+        return start, max(stop - start, 0), step
+    key = int(key)
+    if key < 0:
+        key += size
+    if not 0 <= key < size:
+        raise IndexError(
+            "index {} is out of bounds for size {}".format(key, size))
+    return key, 1, None
+
+
+class LazyRaster(object):
+    """A raster file which is only read when its pixels are needed.
+
+    The dataset is kept open. Metadata (shape, transform, projection,
+    nodata) come from the dataset without touching pixels, and slicing is
+    mapped onto windowed reads. Other attributes of :class:`Raster` are
+    available too, they load the whole raster once on first access.
+
+    Args:
+        ds (gdal.Dataset or str): Dataset or raster file path.
+        band (int or list): Band number. See :func:`read_gdal`.
+        filepath (str): Raster file path.
+    """
+    def __init__(self, ds, band=None, filepath=None):
+        if isinstance(ds, str):
+            ds = gdal.Open(ds)
+        if filepath is None and ds.GetFileList():
+            filepath = os.path.abspath(ds.GetFileList()[0])
+        self.ds = ds
+        self.band = band
+        self.filepath = filepath
+        self._raster = None
+
+    @property
+    def bands(self):
+        """Band numbers which will be read."""
+        if self.band is None:
+            return list(range(1, self.ds.RasterCount + 1))
+        elif isinstance(self.band, int):
+            return [self.band]
+        return list(self.band)
+
+    @property
+    def shape(self):
+        return self.ds.RasterYSize, self.ds.RasterXSize
+
+    @property
+    def transform(self):
+        return tuple(self.ds.GetGeoTransform())
+
+    @property
+    def projection(self):
+        return self.ds.GetProjection()
+
+    @property
+    def nodatavalue(self):
+        return self.ds.GetRasterBand(self.bands[0]).GetNoDataValue()
+
+    @property
+    def dtype(self):
+        return np.dtype(gdal_array.GDALTypeCodeToNumericTypeCode(
+            self.ds.GetRasterBand(self.bands[0]).DataType))
+
+    @property
+    def extent(self):
+        """The extent of raster in current coordinates.
+        [left, right, bottom, top]
+        """
+        left = self.transform[0]
+        right = left + self.transform[1] * self.shape[1]
+        top = self.transform[3]
+        bottom = top + self.transform[5] * self.shape[0]
+        return left, right, bottom, top
+
+    def read(self, window=None, extent=None, overview=None,
+             resolution=None, resampling="nearest"):
+        """Read pixels from the dataset.
+
+        Args:
+            window (tuple): Pixel window ``(xoff, yoff, xsize, ysize)``.
+            extent: Extent or vector. See :func:`read_gdal`.
+            overview (int): Overview level. See :func:`read_gdal`.
+            resolution (float or tuple): Pixel size. See :func:`read_gdal`.
+            resampling (str): Resampling method of decimated reads.
+
+        Returns:
+            :class:`Raster` or a list of :class:`Raster`.
+        """
+        if window is None and extent is None and overview is None and \
+                resolution is None and self._raster is not None:
+            return self._raster
+        return read_gdal(
+            self.ds, self.bands, window, extent, overview=overview,
+            resolution=resolution, resampling=resampling,
+            filepath=self.filepath)
+
+    def preview(self, max_size=1024, resampling="average"):
+        """Read a decimated copy whose longest side is at most
+        ``max_size`` pixels, from overviews when the file has them.
+        """
+        factor = max(self.shape) / max_size
+        if factor <= 1:
+            return self.read()
+        transform = self.transform
+        return self.read(
+            resolution=(abs(transform[1]) * factor,
+                        abs(transform[5]) * factor),
+            resampling=resampling)
+
+    def plot(self, *args, max_size=1024, **kwargs):
+        """Plot a preview, see :meth:`preview` and :meth:`Raster.plot`."""
+        raster = self.preview(max_size)
+        if isinstance(raster, list):
+            raster = raster[0]
+        raster.plot(*args, **kwargs)
+
+    def show(self, *args, **kwargs):
+        """A shortcut of :meth:`self.plot`. Just set ``if_show=True``.
+        """
+        kwargs['if_show'] = True
+        self.plot(*args, **kwargs)
+
+    def load(self):
+        """Read the whole raster once and keep it."""
+        if self._raster is None:
+            self._raster = self.read()
+        return self._raster
+
+    def save(self, out_path=None, driver_name="GTiff", compress=False,
+             options=None, overviews=None, resampling="nearest",
+             profile=None, blocksize=512, level=None):
+        """Save without loading the whole raster.
+
+        Pixels are copied by strips of whole output blocks, the ``cog``
+        profile is streamed by the ``COG`` driver. Explicit overview
+        factors are ignored by the ``cog`` profile, the driver chooses
+        them. See :func:`save` for the arguments.
+
+        Returns:
+            `None` or `gdal.Dataset`
+        """
+        first = self.ds.GetRasterBand(self.bands[0])
+        if profile is not None and out_path:
+            profile_options = _profile_options(
+                profile, driver_name, self.dtype, compress, blocksize, level,
+                resampling)
+            profile_options.update(options or {})
+            if profile == "cog":
+                if len(self.bands) != self.ds.RasterCount:
+                    raise ValueError(
+                        "The cog profile copies all bands of the dataset.")
+                return _copy_cog(self.ds, out_path, profile_options,
+                                 overviews)
+            options, compress = profile_options, False
+
+        xsize, ysize = self.ds.RasterXSize, self.ds.RasterYSize
+        driver, out_raster = _create_dataset(
+            out_path, driver_name, xsize, ysize, len(self.bands),
+            first.DataType, self.projection, self.transform, compress,
+            options)
+        rows = _write_rows(out_raster)
+        for yoff in range(0, ysize, rows):
+            raster = self.read((0, yoff, xsize, min(rows, ysize - yoff)))
+            _write(out_raster, raster if isinstance(raster, list)
+                   else [raster], yoff)
+        _build_overviews(out_raster, overviews, resampling)
+
+        if driver.ShortName == "MEM":
+            return out_raster
+        else:
+            del out_raster
+
+    def clip_by_extent(self, extent):
+        """Read the pixels covering ``extent`` only."""
+        return self.read(extent=extent)
+
+    def clip_by_layer(self, layer):
+        """Read the envelope of ``layer`` only and clip it by ``layer``.
+        """
+        raster = self.read(extent=layer)
+        if isinstance(raster, list):
+            return [r.clip_by_layer(layer) for r in raster]
+        return raster.clip_by_layer(layer)
+
+    def clip_by_shp(self, shp_path, where=None):
+        """Read the envelope of a shapefile only and clip it by shapefile.
+        """
+        shp = ogr.Open(shp_path)
+        layer = shp.GetLayer()
+        if where is not None:
+            layer.SetAttributeFilter(where)
+        return self.clip_by_layer(layer)
+
+    def sample(self, x, y=None, method="nearest"):
+        """Get values of many points from every band.
+
+        Only the window covering the points is read. See
+        :meth:`Raster.sample`.
+
+        Returns:
+            :class:`numpy.ma.MaskedArray`: Shape is ``(points,)`` for one
+            band, or ``(bands, points)``.
+        """
+        row, col = _world_to_pixel(self.transform, *_points(x, y))
+        ysize, xsize = self.shape
+        inside = (row >= 0) & (row < ysize) & (col >= 0) & (col < xsize)
+        bands = len(self.bands)
+        if not inside.any():
+            values = np.ma.masked_all((bands, len(row)), self.dtype)
+            return values[0] if bands == 1 else values
+
+        # Bilinear needs the neighbouring pixels too.
+        margin = 1 if method == "bilinear" else 0
+        top = max(int(np.floor(row[inside].min())) - margin, 0)
+        bottom = min(int(np.floor(row[inside].max())) + margin + 1, ysize)
+        left = max(int(np.floor(col[inside].min())) - margin, 0)
+        right = min(int(np.floor(col[inside].max())) + margin + 1, xsize)
+        rasters = self.read((left, top, right - left, bottom - top))
+        if not isinstance(rasters, list):
+            rasters = [rasters]
+
+        values = np.ma.stack([
+            _sample(r, row - top, col - left, method) for r in rasters])
+        # Points outside of the window are outside of the raster.
+        values[:, ~inside] = np.ma.masked
+        return values[0] if len(rasters) == 1 else values
+
+    def close(self):
+        """Close the dataset."""
+        self.ds = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.load(), dtype)
+
+    def __getitem__(self, key):
+        if self._raster is not None:
+            return self._raster[key]
+
+        keys = key if isinstance(key, tuple) else (key,)
+        keys = keys + (slice(None),) * (2 - len(keys))
+        ranges = None
+        if len(keys) == 2 and all(
+                isinstance(k, (slice, int, np.integer)) for k in keys):
+            ranges = [_slice_to_range(k, n) for k, n in zip(keys, self.shape)]
+        if ranges is None or None in ranges:
+            # Fancy indexing, read everything.
+            return self.load()[key]
+
+        (yoff, ysize, ystep), (xoff, xsize, xstep) = ranges
+        if not xsize or not ysize:
+            return self.load()[key]
+
+        raster = self.read((xoff, yoff, xsize, ysize))
+
+        def pick(r):
+            return r[
+                0 if ystep is None else slice(None, None, ystep),
+                0 if xstep is None else slice(None, None, xstep),
+            ]
+
+        if isinstance(raster, list):
+            return [pick(r) for r in raster]
+        return pick(raster)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return "LazyRaster<{}, {}, {}>".format(
+            self.filepath, self.shape, self.extent)
+
+
+def read(filepath, band=None, window=None, extent=None, lazy=False,
+         stack=False, mmap=False, overview=None, resolution=None,
+         resampling="nearest", **kwargs):
     """Read rasters from file.
 
+    Only the blocks covering ``window`` or ``extent`` are read from disk.
+
     Args:
         filepath (str): Raster file path.
         band (int or list):
             |  Band number (read all bands by default)
             |  Should be a int or list to read one or more bands.
             |  Bands are numbered starting from 1.
+        window (tuple): Only read the pixel window
+            ``(xoff, yoff, xsize, ysize)``.
+        extent: Only read pixels covering the extent. See
+            :func:`read_gdal`.
+        lazy (bool): Return a :class:`LazyRaster` which reads pixels on
+            demand. ``window`` and ``extent`` are ignored.
+        stack (bool): Read all bands with one call into a
+            :class:`RasterStack`.
+        mmap (bool): Map pixels into memory when the file layout allows.
+            See :func:`read_gdal`.
+        overview (int): Read at the resolution of an overview. See
+            :func:`read_gdal`.
+        resolution (float or tuple): Read at this pixel size. See
+            :func:`read_gdal`.
+        resampling (str): Resampling method of decimated reads.
 
     Returns:
-        :class:`Raster` or a list of :class:`Raster`.
+        :class:`Raster` or a list of :class:`Raster`, or
+        :class:`RasterStack` if ``stack=True``.
     """
     ds = gdal.Open(filepath)
     filepath = os.path.abspath(ds.GetFileList()[0])
-    return read_gdal(ds, band, filepath=filepath, **kwargs)
+    if lazy:
+        return LazyRaster(ds, band, filepath)
+    return read_gdal(
+        ds, band, window, extent, stack, mmap, overview, resolution,
+        resampling, filepath=filepath, **kwargs)
 
 
-def save(raster, out_path=None, driver_name="GTiff",
-         compress=False, options=None):
-    """save :class:`Raster` to GeoTIFF file or :class:`gdal.Dataset`.
+def build_vrt(sources, vrt_path=None, resolution="highest",
+              nodatavalue=None, options=None):
+    """Build a VRT mosaic of raster files, no pixels are copied.
 
     Args:
-        raster (Raster or a list of Rasters): Save rasters to file. When it's a
-            list or tuple of :class:`Raster`, save them all as multi bands
-            in one file.
-        out_path (str): The output path. If it is ``None``,
-            return a :class:`gdal.Dataset`.(use MEM driver)
-        driver_name (str): Use which driver to save.(default="GTiff")
-        compress (int):
-            |  Could be following options:
-            |  ``compress=True``  Use LZW to compress
-            |  ``compress=False`` (default) Do not compress
-            |  ``compress='DEFAULT'``
-            |  ``compress='PACKBITS'``
-            |  ... other algorithms gdal supported
+        sources (str or list): Raster files, ``re://`` patterns are
+            expanded (see :func:`gkit.discover.discover`).
+        vrt_path (str): Save the VRT into this file. Kept in memory if it
+            is ``None``.
+        resolution (str or tuple): ``highest`` (default), ``lowest``,
+            ``average`` of the sources, or ``(xres, yres)``.
+        nodatavalue (float): Nodata value of the sources and the mosaic.
+            Use the one of the sources by default.
+        options (dict): Other arguments of :func:`gdal.BuildVRTOptions`.
 
     Returns:
-        `None` or `gdal.Dataset`
+        :class:`gdal.Dataset`
     """
-    if isinstance(raster, Raster):
-        raster = [raster]
+    if isinstance(sources, str):
+        sources = [sources]
+    files = [str(fn) for fn in discover(*map(str, sources))]
+    if not files:
+        raise ValueError("No raster file found in {}.".format(sources))
+
+    options = dict(options or {})
+    if isinstance(resolution, str):
+        options.setdefault("resolution", resolution)
+    else:
+        options.setdefault("resolution", "user")
+        options.setdefault("xRes", abs(resolution[0]))
+        options.setdefault("yRes", abs(resolution[1]))
+    if nodatavalue is not None:
+        options.setdefault("srcNodata", nodatavalue)
+        options.setdefault("VRTNodata", nodatavalue)
+
+    ds = gdal.BuildVRT(vrt_path or "", files,
+                       options=gdal.BuildVRTOptions(**options))
+    if ds is None:
+        raise RuntimeError("Can not build the VRT of {}.".format(sources))
+    return ds
+
+
+def mosaic(sources, band=None, window=None, extent=None, lazy=True,
+           vrt_path=None, resolution="highest", nodatavalue=None,
+           options=None, **kwargs):
+    """Read many adjacent raster files as one raster.
+
+    The files are mosaicked by a VRT (see :func:`build_vrt`), so a window
+    or extent only reads the blocks of the files it covers. Save the lazy
+    mosaic into one file with :meth:`LazyRaster.save`, which copies it
+    block by block.
 
-    dtype = raster[0]._gdal_dtype()
-    xsize, ysize = raster[0].shape[1], raster[0].shape[0]
-    bands = len(raster)
-    projection = raster[0].projection
-    transform = raster[0].transform
+    Args:
+        sources (str or list): Raster files or ``re://`` patterns.
+        band (int or list): Band number. See :func:`read_gdal`.
+        window (tuple): Pixel window of the mosaic. Ignored if ``lazy``.
+        extent: Extent or vector. Ignored if ``lazy``.
+        lazy (bool): Return a :class:`LazyRaster`. (default=True)
+        vrt_path, resolution, nodatavalue, options: See :func:`build_vrt`.
+
+    Returns:
+        :class:`LazyRaster`, or :class:`Raster` (or a list of them) when
+        ``lazy=False``.
+    """
+    ds = build_vrt(sources, vrt_path, resolution, nodatavalue, options)
+    filepath = os.path.abspath(vrt_path) if vrt_path else ""
+    if lazy:
+        return LazyRaster(ds, band, filepath)
+    return read_gdal(ds, band, window, extent, filepath=filepath, **kwargs)
+
+
+def _create_dataset(out_path, driver_name, xsize, ysize, bands, dtype,
+                    projection, transform, compress=False, options=None):
+    """Create an empty dataset. See :func:`save` for the arguments.
 
-    options = options or {}
+    Returns:
+        tuple: ``(driver, dataset)``
+    """
+    options = dict(options or {})
     # Ignore compress option, if use ``MEM`` driver.
     compress = compress if out_path else False
     if compress is True:
@@ -128,16 +740,249 @@ def save(raster, out_path=None, driver_name="GTiff",
 
     out_raster.SetProjection(projection)
     out_raster.SetGeoTransform(transform)
+    return driver, out_raster
+
+
+def _overview_levels(xsize, ysize, min_size=256):
+    """Decimation factors 2, 4, 8... until the overview fits ``min_size``.
+    """
+    levels = []
+    factor = 2
+    while max(xsize, ysize) / factor >= min_size / 2:
+        levels.append(factor)
+        factor *= 2
+    return levels
+
+
+def _build_overviews(ds, overviews, resampling):
+    """Build overviews of a written dataset, see :func:`save`."""
+    if not overviews:
+        return
+    if overviews is True:
+        overviews = _overview_levels(ds.RasterXSize, ds.RasterYSize)
+    if resampling.lower() not in RESAMPLING:
+        raise ValueError("Unknown resampling method {!r}, should be one "
+                         "of {}.".format(resampling, list(RESAMPLING)))
+    ds.FlushCache()
+    ds.BuildOverviews(resampling.upper(), [int(i) for i in overviews])
+
+
+#: Pixels written per call when saving block by block.
+WRITE_PIXELS = 2 ** 22
+
+_PREDICTED = ("DEFLATE", "ZSTD", "LZW", "LZMA")
+
+# Creation option of the compression level of each codec, by profile.
+_LEVEL_OPTIONS = {
+    "tiled": {
+        "DEFLATE": "ZLEVEL",
+        "ZSTD": "ZSTD_LEVEL",
+        "LZMA": "LZMA_PRESET",
+        "LERC_DEFLATE": "ZLEVEL",
+        "LERC_ZSTD": "ZSTD_LEVEL",
+        "JPEG": "JPEG_QUALITY",
+        "WEBP": "WEBP_LEVEL",
+        "JXL": "JXL_EFFORT",
+    },
+    "cog": {
+        "DEFLATE": "LEVEL",
+        "ZSTD": "LEVEL",
+        "LZMA": "LEVEL",
+        "LERC_DEFLATE": "LEVEL",
+        "LERC_ZSTD": "LEVEL",
+        "JPEG": "QUALITY",
+        "WEBP": "QUALITY",
+        "JXL": "JXL_EFFORT",
+    },
+}
+
+# Resampling methods of the overviews of the COG driver.
+_COG_RESAMPLING = ("nearest", "average", "bilinear", "cubic", "cubicspline",
+                   "lanczos", "mode")
+
+
+def _profile_options(profile, driver_name, dtype, compress, blocksize,
+                     level, resampling="nearest"):
+    """Creation options of a ``tiled`` or ``cog`` profile, see :func:`save`.
+    """
+    if profile not in ("tiled", "cog"):
+        raise ValueError(
+            "profile should be 'tiled' or 'cog', got {!r}.".format(profile))
+    if profile == "tiled" and driver_name != "GTiff":
+        raise ValueError("The tiled profile needs the GTiff driver.")
+
+    compress = compress.upper() if isinstance(compress, str) else "DEFLATE"
+    options = {"COMPRESS": compress, "BIGTIFF": "IF_SAFER",
+               "NUM_THREADS": "ALL_CPUS"}
+    if level is not None:
+        if compress not in _LEVEL_OPTIONS[profile]:
+            raise ValueError(
+                "{} compression has no level, level should be None."
+                .format(compress))
+        options[_LEVEL_OPTIONS[profile][compress]] = level
+
+    if profile == "cog":
+        if resampling.lower() not in _COG_RESAMPLING:
+            raise ValueError(
+                "The COG driver does not support {!r} resampling, should "
+                "be one of {}.".format(resampling, list(_COG_RESAMPLING)))
+        options["BLOCKSIZE"] = blocksize
+        options["RESAMPLING"] = resampling.upper()
+        if compress in _PREDICTED:
+            options["PREDICTOR"] = "YES"
+    else:
+        options.update(TILED="YES", BLOCKXSIZE=blocksize,
+                       BLOCKYSIZE=blocksize)
+        if compress in _PREDICTED:
+            options["PREDICTOR"] = 3 if dtype.kind == "f" else 2
+    return options
+
+
+def _write_rows(out_raster):
+    """Rows written per call, whole blocks of about :data:`WRITE_PIXELS`.
+    """
+    block_ysize = out_raster.GetRasterBand(1).GetBlockSize()[1]
+    return max(WRITE_PIXELS // (out_raster.RasterXSize * block_ysize), 1) \
+        * block_ysize
+
+
+def _write(out_raster, raster, yoff=0):
+    """Write a :class:`RasterStack` or a list of :class:`Raster` from row
+    ``yoff`` block by block, at most :data:`WRITE_PIXELS` per call.
+    """
+    rows = _write_rows(out_raster)
+    ysize = raster.shape[1] if isinstance(raster, Raster) else \
+        raster[0].shape[0]
+
+    if isinstance(raster, RasterStack):
+        for i, nodata in enumerate(raster.band_nodata()):
+            # Nodata value must be float type.
+            out_raster.GetRasterBand(i+1).SetNoDataValue(np.float64(nodata))
+        for y in range(0, ysize, rows):
+            out_raster.WriteArray(
+                raster[:, y:y + rows].filled_bands(), 0, yoff + y)
+        return
+    if isinstance(raster, Raster):
+        raster.set_fill_value()  # Make sure fill value is correct.
+        for i in range(raster.shape[0]):
+            # Nodata value must be float type.
+            out_raster.GetRasterBand(i+1).SetNoDataValue(
+                np.float64(raster.fill_value))
+        for y in range(0, ysize, rows):
+            out_raster.WriteArray(
+                raster[:, y:y + rows].filled(), 0, yoff + y)
+        return
 
     for i, r in enumerate(raster):
         out_band = out_raster.GetRasterBand(i+1)
         r.set_fill_value()  # Make sure fill value is correct.
         # Nodata value must be float type.
         out_band.SetNoDataValue(np.float64(r.fill_value))
-        out_band.WriteArray(r.filled())
+        for y in range(0, ysize, rows):
+            out_band.WriteArray(r[y:y + rows].filled(), 0, yoff + y)
         del out_band
 
+
+def save(raster, out_path=None, driver_name="GTiff",
+         compress=False, options=None, overviews=None, resampling="nearest",
+         profile=None, blocksize=512, level=None):
+    """save :class:`Raster` to GeoTIFF file or :class:`gdal.Dataset`.
+
+    Pixels are written block by block, so no full filled copy of the
+    raster is made.
+
+    Args:
+        raster (Raster or a list of Rasters): Save rasters to file. When it's a
+            list or tuple of :class:`Raster`, save them all as multi bands
+            in one file. A :class:`RasterStack` is saved as its bands.
+        out_path (str): The output path. If it is ``None``,
+            return a :class:`gdal.Dataset`.(use MEM driver)
+        driver_name (str): Use which driver to save.(default="GTiff")
+        compress (int):
+            |  Could be following options:
+            |  ``compress=True``  Use LZW to compress
+            |  ``compress=False`` (default) Do not compress
+            |  ``compress='DEFAULT'``
+            |  ``compress='PACKBITS'``
+            |  ... other algorithms gdal supported
+        overviews (bool or list): Build internal overviews, e.g.
+            ``[2, 4, 8]`` for decimation factors. ``True`` halves the size
+            until it is smaller than 256 pixels. (default=None)
+        resampling (str): Resampling method of the overviews, could be
+            ``nearest`` (default), ``average``, ``bilinear``, ``cubic``,
+            ``cubicspline``, ``lanczos``, ``mode`` or ``gauss``
+            (not with the ``cog`` profile).
+        profile (str):
+            |  Could be following options:
+            |  ``None`` (default) Use ``compress`` and ``options`` only.
+            |  ``tiled`` Tiled GeoTIFF with a predictor, ``BIGTIFF=IF_SAFER``
+                and multithreaded compression.
+            |  ``cog`` Cloud Optimized GeoTIFF (``COG`` driver, GDAL >= 3.1)
+                with the same settings, overviews are built unless
+                ``overviews=False``.
+            |  Compression defaults to ``DEFLATE`` (``compress=True``
+                too), ``options`` override any of these settings.
+        blocksize (int): Tile size of a profile. (default=512)
+        level (int): Compression level (or quality) of a profile, e.g.
+            ``ZLEVEL`` of ``DEFLATE``, ``ZSTD_LEVEL`` of ``ZSTD`` or
+            ``LZMA_PRESET`` of ``LZMA``. Codecs without a level like
+            ``LZW`` or ``PACKBITS`` raise ``ValueError``.
+
+    Returns:
+        `None` or `gdal.Dataset`
+    """
+    if isinstance(raster, Raster) and raster.ndim == 2:
+        raster = [raster]
+    first = raster if isinstance(raster, Raster) else raster[0]
+    xsize, ysize = first.shape[-1], first.shape[-2]
+    bands = raster.shape[0] if isinstance(raster, Raster) else len(raster)
+
+    if profile is not None and out_path:
+        profile_options = _profile_options(
+            profile, driver_name, first.dtype, compress, blocksize, level,
+            resampling)
+        profile_options.update(options or {})
+        if profile == "cog":
+            return _save_cog(raster, out_path, xsize, ysize, bands, first,
+                             profile_options, overviews, resampling)
+        options, compress = profile_options, False
+
+    driver, out_raster = _create_dataset(
+        out_path, driver_name, xsize, ysize, bands, first._gdal_dtype(),
+        first.projection, first.transform, compress, options)
+    _write(out_raster, raster)
+    _build_overviews(out_raster, overviews, resampling)
+
     if driver.ShortName == "MEM":
         return out_raster
     else:
         del out_raster
+
+
+def _save_cog(raster, out_path, xsize, ysize, bands, first, options,
+              overviews, resampling):
+    """Write into memory and copy it with the ``COG`` driver."""
+    _, mem = _create_dataset(
+        None, "MEM", xsize, ysize, bands, first._gdal_dtype(),
+        first.projection, first.transform)
+    _write(mem, raster)
+    if overviews not in (None, True, False):
+        _build_overviews(mem, overviews, resampling)
+        options.setdefault("OVERVIEWS", "FORCE_USE_EXISTING")
+    _copy_cog(mem, out_path, options, overviews)
+
+
+def _copy_cog(ds, out_path, options, overviews):
+    """Copy ``ds`` with the ``COG`` driver, which streams its blocks."""
+    driver = gdal.GetDriverByName("COG")
+    if driver is None:
+        raise RuntimeError("The COG driver needs GDAL >= 3.1.")
+    if not out_path.lower().endswith((".tif", ".tiff")):
+        out_path += ".tif"
+
+    if overviews is False:
+        options.setdefault("OVERVIEWS", "NONE")
+
+    options = ["{0}={1}".format(k, v) for k, v in options.items()]
+    out_raster = driver.CreateCopy(out_path, ds, options=options)
+    del out_raster
@@ -1,10 +1,12 @@
 """Wrapping some math functions from numpy, make it
 work fine with :class:`Raster`.
 """
+import builtins
 import warnings
 import numpy as np
 
 from .core import Raster
+from .io import LazyRaster
 
 
 def agg_func(f):
@@ -35,6 +37,175 @@ sum = agg_func(np.ma.sum)
 std = agg_func(np.ma.std)
 
 
+class RunningStats(object):
+    """Per-pixel statistics updated one raster at a time.
+
+    Memory use does not depend on the number of rasters, ``std`` uses
+    Welford's method.
+
+    Args:
+        stats (list of str): Statistics to keep, could be ``count``,
+            ``sum``, ``mean``, ``min``, ``max`` and ``std``.
+    """
+    STATS = ("count", "sum", "mean", "min", "max", "std")
+
+    def __init__(self, stats=STATS):
+        for stat in stats:
+            if stat not in self.STATS:
+                raise ValueError("Unknown statistic {!r}.".format(stat))
+        self.stats = set(stats)
+        self.first = None
+        self.count = None
+
+    def update(self, raster):
+        """Add one raster."""
+        valid = ~np.ma.getmaskarray(raster)
+        data = np.ma.getdata(raster)
+
+        if self.first is None:
+            self.first = raster
+            self.count = np.zeros(raster.shape, np.int32)
+            if self.stats & {"sum", "mean"}:
+                self.total = np.zeros(raster.shape, np.float64)
+            if "std" in self.stats:
+                self.mean = np.zeros(raster.shape, np.float64)
+                self.m2 = np.zeros(raster.shape, np.float64)
+            if "min" in self.stats:
+                self.min = data.copy()
+            if "max" in self.stats:
+                self.max = data.copy()
+        else:
+            if raster.projection != self.first.projection:
+                warnings.warn("Rasters has different projections.")
+            if raster.transform != self.first.transform:
+                warnings.warn("Rasters has different transforms.")
+
+        seen = self.count > 0
+        self.count += valid
+        if self.stats & {"sum", "mean"}:
+            self.total += np.where(valid, data, 0)
+        if "std" in self.stats:
+            delta = np.where(valid, data - self.mean, 0)
+            self.mean += delta / np.maximum(self.count, 1)
+            self.m2 += delta * np.where(valid, data - self.mean, 0)
+        if "min" in self.stats:
+            np.copyto(self.min, data,
+                      where=valid & ~(seen & (self.min <= data)))
+        if "max" in self.stats:
+            np.copyto(self.max, data,
+                      where=valid & ~(seen & (self.max >= data)))
+        return self
+
+    def result(self, stat, ddof=0):
+        """Get a statistic as :class:`Raster`.
+
+        Args:
+            stat (str): Statistic name.
+            ddof (int): Delta degrees of freedom of ``std``.
+        """
+        if stat not in self.stats:
+            raise ValueError("{!r} is not calculated.".format(stat))
+        if self.first is None:
+            raise ValueError("No raster was added.")
+
+        transform, projection = self.first.transform, self.first.projection
+        if stat == "count":
+            return Raster(self.count.copy(), transform, projection)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if stat == "sum":
+                array = self.total
+            elif stat == "mean":
+                array = self.total / self.count
+            elif stat == "std":
+                array = np.sqrt(self.m2 / (self.count - ddof))
+            else:
+                array = getattr(self, stat)
+        return Raster(
+            array.copy(), transform, projection, mask=self.count <= ddof)
+
+
+def stream_func(stat):
+    """Streaming aggregation functions wrapper."""
+    def func(rasters, **kwargs):
+        """Aggregate an iterable of rasters (e.g. a generator) one raster
+        at a time. See :class:`RunningStats`.
+        """
+        stats = RunningStats([stat])
+        for r in rasters:
+            stats.update(r)
+        return stats.result(stat, **kwargs)
+    return func
+
+
+stream_max = stream_func("max")
+stream_min = stream_func("min")
+stream_count = stream_func("count")
+stream_mean = stream_func("mean")
+stream_sum = stream_func("sum")
+stream_std = stream_func("std")
+
+
+def _grid(source, band=1):
+    """``(shape, transform, projection)`` of a source, a file path is
+    opened and closed again."""
+    if isinstance(source, (Raster, LazyRaster)):
+        return (source.shape[-2:], tuple(source.transform),
+                source.projection)
+    with LazyRaster(str(source), band) as r:
+        return r.shape, tuple(r.transform), r.projection
+
+
+def _read_rows(source, yoff, ysize, band=1):
+    """Read rows of a source, a file path is opened and closed again."""
+    if isinstance(source, Raster):
+        return source[yoff:yoff + ysize]
+    if isinstance(source, LazyRaster):
+        return source.read((0, yoff, source.shape[1], ysize))
+    with LazyRaster(str(source), band) as r:
+        return r.read((0, yoff, r.shape[1], ysize))
+
+
+def percentile_by_rows(sources, q, rows=256):
+    """Per-pixel percentile of many rasters, calculated in row chunks.
+
+    Only ``rows`` rows of every raster are held in memory at a time.
+
+    Args:
+        sources (list): Raster file paths, :class:`LazyRaster` or
+            :class:`Raster`. Files are read by windows, they are only
+            open while a chunk is read.
+        q (float): Percentile in ``[0, 100]``.
+        rows (int): Rows per chunk.
+
+    Returns:
+        :class:`Raster`
+    """
+    sources = [
+        s if isinstance(s, (Raster, LazyRaster)) else str(s)
+        for s in sources
+    ]
+    (ysize, xsize), transform, projection = _grid(sources[0])
+
+    out = np.empty((ysize, xsize), np.float64)
+    for yoff in range(0, ysize, rows):
+        n = builtins.min(rows, ysize - yoff)
+        chunk = np.ma.stack([
+            _read_rows(s, yoff, n) for s in sources
+        ]).astype(np.float64).filled(np.nan)
+        with warnings.catch_warnings():
+            # All-NaN pixels are masked below.
+            warnings.simplefilter("ignore", RuntimeWarning)
+            out[yoff:yoff + rows] = np.nanpercentile(chunk, q, axis=0)
+    return Raster(out, transform, projection)
+
+
+def median_by_rows(sources, rows=256):
+    """Per-pixel median of many rasters. See :func:`percentile_by_rows`.
+    """
+    return percentile_by_rows(sources, 50, rows)
+
+
 def ufunc(f):
     """Universal functions wrapper."""
     def func(rasters, *args, **kwargs):
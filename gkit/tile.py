@@ -0,0 +1,153 @@
+"""Tiled, out-of-core processing of rasters larger than memory.
+
+Source files are streamed as block-aligned tiles and every result tile is
+written straight into the output dataset, so peak memory depends on the
+tile size instead of the raster size.
+"""
+import numpy as np
+
+from .core import Raster
+from .io import LazyRaster, read_gdal, _create_dataset
+
+
+#: Approximate number of pixels in one tile.
+TILE_PIXELS = 2 ** 22
+
+
+def _open(source):
+    if isinstance(source, LazyRaster):
+        return source
+    return LazyRaster(str(source))
+
+
+def tile_windows(xsize, ysize, tile_xsize, tile_ysize):
+    """Split a raster into tiles.
+
+    Yields:
+        tuple: Pixel window ``(xoff, yoff, xsize, ysize)``.
+    """
+    for yoff in range(0, ysize, tile_ysize):
+        for xoff in range(0, xsize, tile_xsize):
+            yield (xoff, yoff,
+                   min(tile_xsize, xsize - xoff),
+                   min(tile_ysize, ysize - yoff))
+
+
+def tile_size(ds, band=1, size=None):
+    """Get a tile size aligned to the blocks of ``ds``.
+
+    Args:
+        ds (gdal.Dataset): Source dataset.
+        band (int): Band number whose block size is used.
+        size (tuple): Wanted ``(xsize, ysize)``, rounded up to whole
+            blocks. By default tiles have about :data:`TILE_PIXELS` pixels.
+
+    Returns:
+        tuple: ``(xsize, ysize)``
+    """
+    block_xsize, block_ysize = ds.GetRasterBand(band).GetBlockSize()
+    if size is None:
+        side = int(np.sqrt(TILE_PIXELS))
+        xsize = block_xsize * max(1, side // block_xsize)
+        ysize = block_ysize * max(
+            1, TILE_PIXELS // (min(xsize, ds.RasterXSize) * block_ysize))
+    else:
+        xsize, ysize = size
+        xsize = block_xsize * -(-int(xsize) // block_xsize)
+        ysize = block_ysize * -(-int(ysize) // block_ysize)
+    return min(xsize, ds.RasterXSize), min(ysize, ds.RasterYSize)
+
+
+def iter_tiles(source, band=1, size=None):
+    """Read a raster file tile by tile.
+
+    Args:
+        source (str or LazyRaster): Raster file.
+        band (int): Band number.
+        size (tuple): Tile size, see :func:`tile_size`.
+
+    Yields:
+        tuple: ``(window, Raster)``
+    """
+    source = _open(source)
+    tile_xsize, tile_ysize = tile_size(source.ds, band, size)
+    for window in tile_windows(
+            source.ds.RasterXSize, source.ds.RasterYSize,
+            tile_xsize, tile_ysize):
+        yield window, read_gdal(
+            source.ds, band, window, filepath=source.filepath)
+
+
+def tiled_apply(func, sources, out_path, band=1, size=None,
+                driver_name="GTiff", compress=False, options=None,
+                args=(), kwargs={}):
+    """Apply an element-wise function to rasters tile by tile.
+
+    ``func`` receives one :class:`Raster` tile per source and should return
+    a :class:`Raster` (or a list of them for several output bands) of the
+    same shape, e.g. ``lambda r: gk.log(r) * 2``. Each result is written
+    into ``out_path`` immediately.
+
+    Args:
+        func (function): Element-wise function.
+        sources (str, LazyRaster or list): Raster files on the same grid.
+        out_path (str): The output path. If it is ``None``,
+            return a :class:`gdal.Dataset`.(use MEM driver)
+        band (int): Band number to read from every source.
+        size (tuple): Tile size, see :func:`tile_size`. Tiles are aligned
+            to the blocks of the first source.
+        driver_name (str): Use which driver to save.(default="GTiff")
+        compress: See :func:`gkit.io.save`.
+        options (dict): Creation options of the output dataset.
+
+    Returns:
+        `None` or `gdal.Dataset`
+    """
+    if isinstance(sources, (str, LazyRaster)):
+        sources = [sources]
+    sources = [_open(s) for s in sources]
+    first = sources[0]
+    for s in sources[1:]:
+        if s.shape != first.shape or s.transform != first.transform:
+            raise ValueError(
+                "{} is not on the same grid as {}.".format(
+                    s.filepath, first.filepath))
+
+    tile_xsize, tile_ysize = tile_size(first.ds, band, size)
+    driver = out_raster = None
+    fill_values = None
+    for window in tile_windows(
+            first.ds.RasterXSize, first.ds.RasterYSize,
+            tile_xsize, tile_ysize):
+        tiles = [
+            read_gdal(s.ds, band, window, filepath=s.filepath)
+            for s in sources
+        ]
+        res = func(*tiles, *args, **kwargs)
+        res = [res] if isinstance(res, np.ndarray) else list(res)
+
+        if out_raster is None:
+            res = [
+                r if isinstance(r, Raster) else
+                Raster(r, tiles[0].transform, tiles[0].projection)
+                for r in res
+            ]
+            driver, out_raster = _create_dataset(
+                out_path, driver_name, first.shape[1], first.shape[0],
+                len(res), res[0]._gdal_dtype(), first.projection,
+                first.transform, compress, options)
+            fill_values = []
+            for i, r in enumerate(res):
+                r.set_fill_value()  # Make sure fill value is correct.
+                fill_values.append(r.fill_value)
+                out_raster.GetRasterBand(i+1).SetNoDataValue(
+                    np.float64(r.fill_value))
+
+        for i, r in enumerate(res):
+            out_raster.GetRasterBand(i+1).WriteArray(
+                np.ma.filled(r, fill_values[i]), window[0], window[1])
+
+    if driver.ShortName == "MEM":
+        return out_raster
+    else:
+        del out_raster
@@ -0,0 +1,340 @@
+"""Rasters of one grid along time, with per-pixel time series operations.
+
+The grid of all time steps is checked once. Operations run by chunks of
+rows: a ``(times, rows, cols)`` block is read (or sliced from memory),
+reduced along time with vectorized numpy operations and written into the
+result, so a long series never has to fit in memory.
+"""
+import warnings
+
+import numpy as np
+from osgeo import gdal
+
+from .core import Raster, RasterStack
+from .io import LazyRaster, _create_dataset
+from .math import _grid, _read_rows
+
+
+def _elapsed(times):
+    """Times as floats, days since the first time for dates."""
+    times = np.asarray(times)
+    if np.issubdtype(times.dtype, np.datetime64):
+        return (times - times[0]) / np.timedelta64(1, "D")
+    return times.astype(np.float64)
+
+
+def _groups(times, by):
+    """Group labels of time steps, see :meth:`TimeSeries.anomaly`."""
+    if not isinstance(by, str):
+        groups = np.asarray(by)
+        if len(groups) != len(times):
+            raise ValueError("There should be one group per time step.")
+        return groups
+
+    times = np.asarray(times)
+    if not np.issubdtype(times.dtype, np.datetime64):
+        raise ValueError(
+            "Grouping by {!r} needs datetime64 times.".format(by))
+    if by == "month":
+        return times.astype("datetime64[M]").astype(np.int64) % 12
+    if by == "dayofyear":
+        return (times.astype("datetime64[D]") -
+                times.astype("datetime64[Y]")).astype(np.int64)
+    raise ValueError(
+        "by should be 'month', 'dayofyear' or group labels, got {!r}."
+        .format(by))
+
+
+class TimeSeries(object):
+    """Rasters of one grid ordered by time.
+
+    Args:
+        sources (list or RasterStack): :class:`Raster`, :class:`LazyRaster`
+            or raster file paths, one per time step, or a
+            :class:`RasterStack` whose bands are the time steps. Files are
+            read by rows when needed, they are only open while a chunk is
+            read.
+        times (array_like): Time of each step, numbers or ``datetime64``.
+            (default: ``0, 1, 2...``)
+        band (int): Band number read from every file.
+        layout (str):
+            |  Could be following options:
+            |  ``None`` (default) Keep the sources as they are.
+            |  ``time`` Load all steps into one ``(times, rows, cols)``
+                array.
+            |  ``pixel`` Load all steps into one ``(rows, cols, times)``
+                array, the series of a pixel is contiguous.
+        rows (int): Rows per chunk. (default=256)
+
+    Raises:
+        ValueError: The sources are not on the same grid.
+    """
+    def __init__(self, sources, times=None, band=1, layout=None, rows=256):
+        if isinstance(sources, Raster) and sources.ndim == 3:
+            self._sources = None
+            self._array = sources.view(np.ma.MaskedArray)
+            self._layout = "time"
+            first = _grid(sources, band)
+        else:
+            self._sources = [
+                s if isinstance(s, (Raster, LazyRaster)) else str(s)
+                for s in sources]
+            self._array = None
+            self._layout = None
+            if not self._sources:
+                raise ValueError("A time series needs one raster at least.")
+            first = _grid(self._sources[0], band)
+            for s in self._sources[1:]:
+                if _grid(s, band) != first:
+                    raise ValueError(
+                        "{} is not on the same grid as {}.".format(
+                            getattr(s, "filepath", s),
+                            getattr(self._sources[0], "filepath",
+                                    self._sources[0])))
+
+        shape, self.transform, self.projection = first
+        self.band = band
+        self.rows = rows
+        count = len(self._array) if self._sources is None \
+            else len(self._sources)
+        self.times = np.arange(count) if times is None else \
+            np.asarray(times)
+        if len(self.times) != count:
+            raise ValueError("There are {} rasters but {} times.".format(
+                count, len(self.times)))
+        self._ysize, self._xsize = shape
+
+        if layout is not None:
+            self.load(layout)
+
+    @property
+    def shape(self):
+        """``(times, rows, cols)``"""
+        return len(self.times), self._ysize, self._xsize
+
+    def __len__(self):
+        return len(self.times)
+
+    def load(self, layout="time"):
+        """Load all time steps into memory in ``time`` or ``pixel`` layout.
+        """
+        if layout not in ("time", "pixel"):
+            raise ValueError(
+                "layout should be 'time' or 'pixel', got {!r}.".format(
+                    layout))
+        if layout == self._layout:
+            return self
+
+        times, ysize, xsize = self.shape
+        shape = (times, ysize, xsize) if layout == "time" else \
+            (ysize, xsize, times)
+        array = mask = None
+        for yoff, block in self.chunks():
+            if array is None:
+                array = np.empty(shape, block.dtype)
+                mask = np.zeros(shape, bool)
+            if layout == "time":
+                array[:, yoff:yoff + block.shape[1]] = block.data
+                mask[:, yoff:yoff + block.shape[1]] = \
+                    np.ma.getmaskarray(block)
+            else:
+                array[yoff:yoff + block.shape[1]] = \
+                    np.moveaxis(block.data, 0, -1)
+                mask[yoff:yoff + block.shape[1]] = \
+                    np.moveaxis(np.ma.getmaskarray(block), 0, -1)
+
+        self._array = np.ma.masked_array(array, mask)
+        self._layout = layout
+        self._sources = None
+        return self
+
+    def chunks(self, rows=None):
+        """Iterate the series by rows.
+
+        Yields:
+            tuple: ``(yoff, block)``, ``block`` is a
+            ``(times, rows, cols)`` masked array.
+        """
+        rows = rows or self.rows
+        ysize = self._ysize
+        for yoff in range(0, ysize, rows):
+            n = min(rows, ysize - yoff)
+            if self._layout == "time":
+                block = self._array[:, yoff:yoff + n]
+            elif self._layout == "pixel":
+                block = np.moveaxis(self._array[yoff:yoff + n], -1, 0)
+            else:
+                block = np.ma.stack([
+                    np.ma.asarray(_read_rows(s, yoff, n, self.band))
+                    for s in self._sources])
+            yield yoff, block
+
+    def apply(self, func, bands=1, out_path=None, rows=None):
+        """Apply a function to each chunk and gather the results.
+
+        Args:
+            func (function): Receives a ``(times, rows, cols)`` masked
+                array and returns ``(rows, cols)``, or
+                ``(bands, rows, cols)`` for several output bands.
+            bands (int): Number of output bands.
+            out_path (str): Write the result into this GeoTIFF chunk by
+                chunk instead of returning it.
+            rows (int): Rows per chunk.
+
+        Returns:
+            :class:`Raster`, :class:`RasterStack` when ``bands > 1``, or
+            ``None`` when ``out_path`` is given.
+        """
+        _, ysize, xsize = self.shape
+        out = mask = out_raster = None
+        if out_path:
+            _, out_raster = _create_dataset(
+                out_path, "GTiff", xsize, ysize, bands, gdal.GDT_Float64,
+                self.projection, self.transform, compress=True)
+            for i in range(bands):
+                out_raster.GetRasterBand(i + 1).SetNoDataValue(np.nan)
+        else:
+            out = np.empty((bands, ysize, xsize), np.float64)
+            mask = np.zeros((bands, ysize, xsize), bool)
+
+        for yoff, block in self.chunks(rows):
+            res = np.ma.asarray(func(block))
+            res = res.reshape((bands,) + block.shape[1:])
+            if out_raster is not None:
+                out_raster.WriteArray(
+                    res.astype(np.float64).filled(np.nan), 0, yoff)
+            else:
+                out[:, yoff:yoff + res.shape[1]] = res.data
+                mask[:, yoff:yoff + res.shape[1]] = np.ma.getmaskarray(res)
+
+        if out_raster is not None:
+            del out_raster
+            return None
+        if bands == 1:
+            return Raster(np.ma.masked_array(out[0], mask[0]),
+                          self.transform, self.projection)
+        return RasterStack(np.ma.masked_array(out, mask), self.transform,
+                           self.projection)
+
+    def reduce(self, func, out_path=None, rows=None):
+        """Reduce the series of each pixel, e.g. ``np.ma.mean``.
+
+        Args:
+            func (function): ``numpy.ma`` function accepting ``axis``.
+        """
+        return self.apply(lambda block: func(block, axis=0),
+                          out_path=out_path, rows=rows)
+
+    def trend(self, out_path=None, rows=None):
+        """Least squares slope of each pixel against time.
+
+        The slope is per day for ``datetime64`` times, otherwise per unit
+        of ``times``. Pixels with less than 2 valid steps are masked.
+
+        Returns:
+            :class:`Raster`
+        """
+        t = _elapsed(self.times)[:, None, None]
+
+        def slope(block):
+            valid = ~np.ma.getmaskarray(block)
+            values = np.where(valid, block.data, 0).astype(np.float64)
+            n = valid.sum(axis=0)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                t_mean = (valid * t).sum(axis=0) / n
+                v_mean = values.sum(axis=0) / n
+                dt = np.where(valid, t - t_mean, 0)
+                sxy = (dt * (values - v_mean)).sum(axis=0)
+                sxx = (dt * dt).sum(axis=0)
+                res = sxy / sxx
+            return np.ma.masked_array(res, (n < 2) | (sxx == 0))
+
+        return self.apply(slope, out_path=out_path, rows=rows)
+
+    def rolling_mean(self, window, min_count=1, out_path=None, rows=None):
+        """Mean of each pixel over the last ``window`` time steps
+        (including the current one), ignoring masked steps.
+
+        Steps with less than ``min_count`` valid values in the window are
+        masked.
+
+        Returns:
+            :class:`RasterStack` with one band per time step.
+        """
+        def mean(block):
+            valid = ~np.ma.getmaskarray(block)
+            values = np.where(valid, block.data, 0).astype(np.float64)
+            shape = (1,) + block.shape[1:]
+            total = np.concatenate([np.zeros(shape), values.cumsum(axis=0)])
+            count = np.concatenate(
+                [np.zeros(shape, np.int64), valid.cumsum(axis=0)])
+            total = total[1:] - total[np.maximum(
+                np.arange(1, len(total)) - window, 0)]
+            count = count[1:] - count[np.maximum(
+                np.arange(1, len(count)) - window, 0)]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return np.ma.masked_array(total / count,
+                                          count < max(min_count, 1))
+
+        return self.apply(mean, len(self), out_path, rows)
+
+    def climatology(self, by="month", out_path=None, rows=None):
+        """Mean of each pixel per group of time steps.
+
+        Args:
+            by (str or array_like): ``month``, ``dayofyear`` (both need
+                ``datetime64`` times) or a group label per time step.
+
+        Returns:
+            tuple: ``(groups, RasterStack)``, one band per sorted group.
+        """
+        labels, index = np.unique(_groups(self.times, by),
+                                  return_inverse=True)
+
+        def mean(block):
+            return np.ma.stack([block[index == i].mean(axis=0)
+                                for i in range(len(labels))])
+
+        return labels, self.apply(mean, len(labels), out_path, rows)
+
+    def anomaly(self, by="month", out_path=None, rows=None):
+        """Difference of each step from the mean of its group over the
+        whole series (see :meth:`climatology`).
+
+        Returns:
+            :class:`RasterStack` with one band per time step.
+        """
+        labels, index = np.unique(_groups(self.times, by),
+                                  return_inverse=True)
+
+        def anomaly(block):
+            block = block.astype(np.float64)
+            means = np.ma.stack([block[index == i].mean(axis=0)
+                                 for i in range(len(labels))])
+            return block - means[index]
+
+        return self.apply(anomaly, len(self), out_path, rows)
+
+    def percentile(self, q, out_path=None, rows=None):
+        """Percentiles of each pixel over time, ignoring masked steps.
+
+        Args:
+            q (float or list): Percentiles in ``[0, 100]``.
+
+        Returns:
+            :class:`Raster`, or :class:`RasterStack` with one band per
+            percentile when ``q`` is a list.
+        """
+        def percentile(block):
+            values = block.astype(np.float64).filled(np.nan)
+            with warnings.catch_warnings():
+                # All-NaN pixels are masked below.
+                warnings.simplefilter("ignore", RuntimeWarning)
+                res = np.nanpercentile(values, q, axis=0)
+            return np.ma.masked_invalid(res)
+
+        return self.apply(percentile, np.size(q), out_path, rows)
+
+    def __repr__(self):
+        return "TimeSeries<{} steps, {} to {}, {}>".format(
+            len(self), self.times[0], self.times[-1], self.shape[1:])